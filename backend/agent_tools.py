@@ -1,14 +1,37 @@
+import csv
+import io
+import json
+import logging
 from pydantic import BaseModel, Field
 from langchain.agents import tool
 from database import Database
+from query_guard import QueryRejected
+from value_catalog import get_catalog
+from schema_catalog import get_schema_catalog
+from sql_validator import validate_and_correct
 
 db_instance: Database | None = None
-VALID_TABLES = ["vehicle_ads", "price_table", "sales_table", "basic_table", "trim_table"]
+VALID_TABLES = ["vehicle_ads", "price_table", "sales_table", "basic_table", "trim_table",
+                "sales_by_year", "model_listing_stats", "maker_listing_stats", "year_listing_stats"]
 
 def set_database_instance(db: Database):
     global db_instance
     db_instance = db
 
+def _validate_query(query: str):
+    """Compiles the query locally and fixes unambiguous identifier mistakes before it runs.
+
+    Returns ``(query, corrections, error)``. Validation problems of its own never block
+    execution; the query then runs as written.
+    """
+    try:
+        schema = get_schema_catalog(db_instance, VALID_TABLES)
+        sales_years = {c for c, _ in schema.get("sales_table", []) if c.isdigit()}
+        return validate_and_correct(query, db_instance.compile_error, schema, sales_years)
+    except Exception:
+        logging.warning("SQL pre-validation failed; running query unvalidated.", exc_info=True)
+        return query, [], None
+
 @tool
 def execute_sql(query: str) -> str:
     """Executes a SQL query and returns the result as CSV."""
@@ -18,9 +41,17 @@ def execute_sql(query: str) -> str:
     if not query.strip().upper().startswith("SELECT"):
         return f"Error: Only SELECT queries are allowed."
 
+    query, corrections, validation_error = _validate_query(query)
+    if validation_error:
+        return f"SQL Validation Error: {validation_error}"
+
     try:
         result = db_instance.run_query(query)
+        if corrections:
+            result = f"Note: query auto-corrected before running ({'; '.join(corrections)}).\n{result}"
         return result
+    except QueryRejected as e:
+        return f"Query Rejected: {json.dumps(e.to_dict())}"
     except Exception as e:
         return f"SQL Execution Error: {str(e)}"
 
@@ -35,11 +66,30 @@ def get_table_schema(table_name: str) -> str:
     return db_instance.run_query(query)
 
 @tool
-def get_distinct_values(table_name: str, column_name: str) -> str:
-    """Returns distinct values from a table's column."""
+def get_distinct_values(table_name: str, column_name: str, search: str = "") -> str:
+    """Returns the most frequent values of a table's text column with its number of distinct values.
+    Pass `search` (e.g. a model name like "F150") to find the matching stored values by exact,
+    normalized, prefix or fuzzy match."""
     if db_instance is None:
         return "Error: Database not initialized."
     if table_name not in VALID_TABLES:
         return f"Error: Invalid table name '{table_name}'."
-    query = f'SELECT DISTINCT "{column_name}" FROM "{table_name}" WHERE "{column_name}" IS NOT NULL LIMIT 10;'
-    return db_instance.run_query(query)
\ No newline at end of file
+
+    catalog = get_catalog(db_instance)
+    if catalog is None or not catalog.has_column(table_name, column_name):
+        query = f'SELECT DISTINCT "{column_name}" FROM "{table_name}" WHERE "{column_name}" IS NOT NULL LIMIT 10;'
+        return db_instance.run_query(query)
+
+    cardinality, non_null = catalog.columns[(table_name, column_name)]
+    header = f"{table_name}.{column_name}: {cardinality} distinct values in {non_null} non-null rows"
+    if search.strip():
+        match_type, matches = catalog.search(table_name, column_name, search)
+        if not matches:
+            return f"{header}\nNo values match '{search}'."
+        lines = [f"{header}\nValues matching '{search}' ({match_type} match):", "value,frequency"]
+    else:
+        matches = catalog.top_values(table_name, column_name)
+        lines = [f"{header}\nMost frequent values:", "value,frequency"]
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(matches)
+    return "\n".join(lines) + "\n" + buffer.getvalue()
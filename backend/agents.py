@@ -1,39 +1,182 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from typing import ClassVar
+from concurrent.futures import ThreadPoolExecutor
 from langchain_google_vertexai import ChatVertexAI
 from langchain.agents import AgentExecutor
+from langchain_core.rate_limiters import InMemoryRateLimiter
 from langchain.agents.format_scratchpad.openai_tools import format_to_openai_tool_messages
 from langchain.agents.output_parsers.openai_tools import OpenAIToolsAgentOutputParser
-from prompts import get_sql_generation_prompt
+from prompts import get_sql_generation_prompt, schema_for_question
 from langchain.schema import AIMessage, HumanMessage
-from agent_tools import execute_sql, get_table_schema, get_distinct_values
+import agent_tools
+from agent_tools import execute_sql, get_table_schema, get_distinct_values, VALID_TABLES
+from tracing import llm_timing, stage
 
 tools = [execute_sql, get_table_schema, get_distinct_values]
 
-def create_sql_agent():
-    llm = ChatVertexAI(
-        model="gemini-2.5-flash",
-        temperature=0,
-        convert_system_message_to_human=True,
-        project="autoquery-472902"
-    )
-    llm_with_tools = llm.bind_tools(tools)
+# Tools with no side effects; connections are opened with PRAGMA query_only, so execute_sql qualifies.
+READ_ONLY_TOOLS = {"execute_sql", "get_table_schema", "get_distinct_values"}
+TOOL_WORKERS = int(os.environ.get("AUTOQUERY_TOOL_WORKERS", 4))
+GOOGLE_CLOUD_PROJECT = os.environ.get("GOOGLE_CLOUD_PROJECT", "autoquery-472902")
+# Process-wide cap on Gemini requests, shared by every agent so batch runs cannot exhaust the quota.
+LLM_REQUESTS_PER_SECOND = float(os.environ.get("AUTOQUERY_LLM_REQUESTS_PER_SECOND", 5))
+LLM_MAX_BURST = float(os.environ.get("AUTOQUERY_LLM_MAX_BURST", 10))
+
+llm_rate_limiter = InMemoryRateLimiter(
+    requests_per_second=LLM_REQUESTS_PER_SECOND,
+    check_every_n_seconds=0.05,
+    max_bucket_size=LLM_MAX_BURST,
+) if LLM_REQUESTS_PER_SECOND > 0 else None
+
+_tool_pool = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="agent-tool")
+_tool_step_stats = {"steps": 0, "parallel_steps": 0, "tool_calls": 0,
+                    "wall_ms_total": 0.0, "serial_ms_total": 0.0}
+_tool_step_lock = threading.Lock()
+
+
+class _PendingAction:
+    """Placeholder for a tool call whose execution ParallelToolAgentExecutor defers."""
+
+    def __init__(self, args):
+        self.args = args
+
+
+class ParallelToolAgentExecutor(AgentExecutor):
+    """AgentExecutor that runs the read-only tool calls of one agent step concurrently.
+
+    Observations are returned in the order the model emitted the calls. Consecutive
+    read-only calls run together on a shared bounded pool; any other tool acts as a
+    barrier and runs on its own.
+    """
+
+    # Per-thread flag; one executor instance serves every request thread.
+    _deferring: ClassVar[threading.local] = threading.local()
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        if getattr(self._deferring, "active", False):
+            return _PendingAction((name_to_tool_map, color_mapping, agent_action, run_manager))
+        return super()._perform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+
+    def _timed_action(self, args):
+        start = time.perf_counter()
+        with stage("tool"):
+            step = super()._perform_agent_action(*args)
+        return step, (time.perf_counter() - start) * 1000
+
+    def _run_pending(self, pending):
+        """Runs deferred tool calls, returning ``[(AgentStep, elapsed_ms)]`` in call order."""
+        results = []
+        group = []
+
+        def flush():
+            if len(group) == 1:
+                results.append(self._timed_action(group[0].args))
+            elif group:
+                # Each call gets a copy of the caller's context so callbacks and tracing still attach.
+                futures = [_tool_pool.submit(contextvars.copy_context().run, self._timed_action, p.args)
+                           for p in group]
+                results.extend(f.result() for f in futures)
+            group.clear()
+
+        for p in pending:
+            group.append(p)
+            if p.args[2].tool not in READ_ONLY_TOOLS:
+                # Side-effecting tools run alone, after everything emitted before them.
+                last = group.pop()
+                flush()
+                group.append(last)
+                flush()
+        flush()
+        return results
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        steps = super()._iter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager)
+        pending = []
+        while True:
+            # Deferral is only switched on while the base generator runs, never while our caller does.
+            self._deferring.active = True
+            try:
+                item = next(steps)
+            except StopIteration:
+                break
+            finally:
+                self._deferring.active = False
+            if isinstance(item, _PendingAction):
+                pending.append(item)
+            else:
+                yield item
+        if not pending:
+            return
+
+        start = time.perf_counter()
+        results = self._run_pending(pending)
+        wall_ms = (time.perf_counter() - start) * 1000
+        serial_ms = sum(elapsed for _, elapsed in results)
+        with _tool_step_lock:
+            _tool_step_stats["steps"] += 1
+            _tool_step_stats["parallel_steps"] += len(results) > 1
+            _tool_step_stats["tool_calls"] += len(results)
+            _tool_step_stats["wall_ms_total"] += wall_ms
+            _tool_step_stats["serial_ms_total"] += serial_ms
+        if len(results) > 1:
+            logging.info(f"Ran {len(results)} tool calls in {wall_ms:.1f} ms "
+                         f"(sequential would take ~{serial_ms:.1f} ms, saved {serial_ms - wall_ms:.1f} ms).")
+        for step, _ in results:
+            yield step
+
+
+def tool_step_stats() -> dict:
+    """Wall-clock vs. summed tool time over all agent steps that ran tools."""
+    with _tool_step_lock:
+        s = dict(_tool_step_stats)
+    s["wall_ms_total"] = round(s["wall_ms_total"], 1)
+    s["serial_ms_total"] = round(s["serial_ms_total"], 1)
+    s["saved_ms_total"] = round(s["serial_ms_total"] - s["wall_ms_total"], 1)
+    s["max_workers"] = TOOL_WORKERS
+    return s
+
+def create_sql_agent(llm=None):
+    """Builds the SQL agent. ``llm`` defaults to Gemini on Vertex AI; any tool-calling chat model works."""
+    if llm is None:
+        llm = ChatVertexAI(
+            model="gemini-2.5-flash",
+            temperature=0,
+            convert_system_message_to_human=True,
+            project=GOOGLE_CLOUD_PROJECT,
+            # Uses the streaming endpoint so /api/chat/stream callbacks receive answer tokens as generated.
+            streaming=True,
+            rate_limiter=llm_rate_limiter
+        )
+    llm_with_tools = llm.bind_tools(tools).with_config(callbacks=[llm_timing])
 
     prompt = get_sql_generation_prompt()
 
     def input_extractor(x):
         return x.get("input", x.get("question", ""))
 
+    def schema_selector(x):
+        # The previous question is included so follow-ups ("what about 2019?") keep its tables.
+        previous = [m.content for m in x.get("chat_history", []) if isinstance(m, HumanMessage)][-1:]
+        with stage("prompt_build"):
+            return schema_for_question(agent_tools.db_instance, VALID_TABLES, input_extractor(x), " ".join(previous))
+
     def scratchpad_formatter(x):
         return format_to_openai_tool_messages(x.get("intermediate_steps", []))
 
     agent_components = {
         "input": input_extractor,
         "agent_scratchpad": scratchpad_formatter,
+        "schema": schema_selector,
         "chat_history": lambda x: x.get("chat_history", [])
     }
 
     agent = agent_components | prompt | llm_with_tools | OpenAIToolsAgentOutputParser()
 
-    agent_executor = AgentExecutor(
+    agent_executor = ParallelToolAgentExecutor(
         agent=agent,
         tools=tools,
         verbose=True,
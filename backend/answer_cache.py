@@ -0,0 +1,110 @@
+import os
+import re
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+ANSWER_CACHE_TTL = float(os.environ.get("AUTOQUERY_ANSWER_CACHE_TTL", 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("AUTOQUERY_ANSWER_CACHE_SIZE", 512))
+
+MIN_FOLLOW_UP_WORDS = 3
+# What AgentExecutor returns when it gives up; not an answer, so never cached.
+AGENT_STOPPED_PREFIX = "Agent stopped due to"
+
+
+def normalize_question(question: str) -> str:
+    """Lower-cases, strips punctuation and collapses whitespace."""
+    text = re.sub(r"[^\w\s-]", " ", question.lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _message_text(message) -> str:
+    return str(getattr(message, "content", message))
+
+
+def history_fingerprint(chat_history: list, window: int | None = None) -> str:
+    """Hash of the last ``window`` messages (all by default); what a follow-up question can refer to."""
+    recent = chat_history[-window:] if window else chat_history
+    raw = "\x00".join(f"{type(m).__name__}:{_message_text(m)}" for m in recent)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(question: str, chat_history: list):
+    """Returns the cache key for a question, or None when the lookup should be skipped.
+
+    Opening questions are keyed on the question alone. Anything asked mid-conversation can
+    lean on earlier turns ("which one is the cheapest?"), so it is keyed on the whole chat
+    history as well and only hits within the same conversation state. Very short
+    questions asked mid-conversation ("why?") are not cached at all.
+    """
+    normalized = normalize_question(question)
+    if not normalized:
+        return None
+    if not chat_history:
+        return f"{normalized}|"
+    if len(normalized.split()) < MIN_FOLLOW_UP_WORDS:
+        return None
+    return f"{normalized}|{history_fingerprint(chat_history)}"
+
+
+def is_cacheable_output(output) -> bool:
+    """False for empty outputs and for AgentExecutor's iteration/time-limit message."""
+    return bool(output and str(output).strip()) and not str(output).startswith(AGENT_STOPPED_PREFIX)
+
+
+class AnswerCache:
+    """Thread-safe TTL + LRU cache of final /api/chat payloads."""
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl: float = ANSWER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skips = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            if key is None:
+                self.skips += 1
+                return None
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, payload = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return dict(payload)
+
+    def set(self, key, payload: dict):
+        if key is None or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.monotonic(), dict(payload))
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "skips": self.skips,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
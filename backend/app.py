@@ -1,19 +1,108 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from agents import create_sql_agent
+from agents import create_sql_agent, tool_step_stats
 from agent_tools import set_database_instance
 from database import Database
-from langchain.schema import AIMessage, HumanMessage
+from answer_cache import AnswerCache, cache_key, is_cacheable_output
+from streaming import stream_agent_run
+from session_memory import Session, SessionStore, new_session_id
+from intent_router import IntentRouter
+from batch import BATCH_MAX_QUESTIONS, BATCH_WORKERS, run_batch
+from value_catalog import get_catalog
+from tracing import metrics, trace_request
+import json
+import threading
+import time
 import os
 
 db = Database()
 set_database_instance(db)
-agent_executor = create_sql_agent()
+# Built on first use (or by the App Engine warmup request), so importing the app needs no Vertex AI access.
+agent_executor = None
+agent_executor_lock = threading.Lock()
+answer_cache = AnswerCache()
+sessions = SessionStore()
+router = IntentRouter(db)
 
-chat_history = []
 app = Flask(__name__)
 CORS(app)
 
+# "server" timings are taken when the stream generator yields an event; a buffering front end
+# (App Engine standard) can hold the bytes back until the response ends. "client" timings are
+# reported by the frontend from when bytes actually arrived.
+stream_stats = {"streams": 0, "first_progress_ms_total": 0.0, "token_streams": 0, "first_token_ms_total": 0.0,
+                "total_ms_total": 0.0, "client_reports": 0, "client_first_byte_ms_total": 0.0,
+                "client_token_reports": 0, "client_first_token_ms_total": 0.0, "client_total_ms_total": 0.0}
+CLIENT_TIMING_MAX_MS = 600_000
+stream_stats_lock = threading.Lock()
+
+def session_id_from(data):
+    """The client's session ID (JSON ``session_id`` or ``X-Session-ID`` header), or a new one."""
+    return str(data.get("session_id") or request.headers.get("X-Session-ID") or new_session_id())
+
+def get_agent_executor():
+    global agent_executor
+    if agent_executor is None:
+        with agent_executor_lock:
+            if agent_executor is None:
+                agent_executor = create_sql_agent()
+    return agent_executor
+
+def run_agent(user_message, session_id, callbacks=None):
+    """Answers one message (from the answer cache when possible) and returns the response payload."""
+    return answer_in_session(user_message, sessions.get(session_id), callbacks)
+
+def answer_in_session(user_message, session, callbacks=None):
+    """Like ``run_agent``, for a ``Session`` that is not kept in the shared session store."""
+    with trace_request():
+        return _answer(user_message, session, callbacks)
+
+def _answer(user_message, session, callbacks):
+    chat_history = session.history()
+    key = cache_key(user_message, chat_history)
+    response_payload = answer_cache.get(key)
+    if response_payload is None:
+        response_payload = router.route(user_message)
+    if response_payload is None:
+        agent_start = time.perf_counter()
+        config = {"callbacks": callbacks} if callbacks else None
+        result = get_agent_executor().invoke({"input": user_message, "chat_history": chat_history}, config=config)
+        router.record_agent_run((time.perf_counter() - agent_start) * 1000)
+        final_response = result.get("output", "Sorry, I encountered an issue.")
+
+        agent_steps = ""
+        if "intermediate_steps" in result:
+            for action, observation in result["intermediate_steps"]:
+                agent_steps += f"Tool Used: {action.tool}\n"
+                tool_input_str = str(action.tool_input).replace('\n', ' ')
+                agent_steps += f"Tool Input: {tool_input_str}\n\n"
+
+        if not agent_steps:
+            agent_steps = "No tools were used for this response."
+
+        response_payload = {
+            "agent_steps": agent_steps.strip(),
+            "final_response": final_response
+        }
+        if is_cacheable_output(result.get("output")):
+            answer_cache.set(key, response_payload)
+    try:
+        catalog = get_catalog(db)
+    except Exception:
+        catalog = None
+    session.record(user_message, response_payload["final_response"], catalog)
+    return {**response_payload, "session_id": session.session_id}
+
+def record_stream_timings(timings):
+    """Server-side stream timings, measured when each event is yielded (not when it reaches the client)."""
+    with stream_stats_lock:
+        stream_stats["streams"] += 1
+        stream_stats["first_progress_ms_total"] += timings.get("first_progress_ms", timings.get("total_ms", 0.0))
+        if "first_token_ms" in timings:
+            stream_stats["token_streams"] += 1
+            stream_stats["first_token_ms_total"] += timings["first_token_ms"]
+        stream_stats["total_ms_total"] += timings.get("total_ms", 0.0)
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     data = request.get_json()
@@ -22,28 +111,117 @@ def chat():
     if not user_message:
         return jsonify({"error": "Message cannot be empty."}), 400
 
-    result = agent_executor.invoke({"input": user_message, "chat_history": chat_history})
-    final_response = result.get("output", "Sorry, I encountered an issue.")
+    return jsonify(run_agent(user_message, session_id_from(data)))
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Server-sent events: tool calls, SQL and observation summaries as they happen, then answer tokens."""
+    started_at = time.perf_counter()
+    data = request.get_json()
+    user_message = data.get("message", "").strip()
+
+    if not user_message:
+        return jsonify({"error": "Message cannot be empty."}), 400
+
+    session_id = session_id_from(data)
+    events = stream_agent_run(lambda handler: run_agent(user_message, session_id, [handler]),
+                              started_at, record_stream_timings)
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.route('/api/chat/stream/timings', methods=['POST'])
+def chat_stream_timings():
+    """Client-measured stream timings (first byte, first token, total), sent by the frontend after each stream."""
+    data = request.get_json(silent=True) or {}
+    timings = {}
+    for name in ("first_byte_ms", "first_token_ms", "total_ms"):
+        value = data.get(name)
+        if isinstance(value, (int, float)) and 0 <= value <= CLIENT_TIMING_MAX_MS:
+            timings[name] = float(value)
+    if "first_byte_ms" not in timings or "total_ms" not in timings:
+        return jsonify({"error": "first_byte_ms and total_ms are required."}), 400
+    with stream_stats_lock:
+        stream_stats["client_reports"] += 1
+        stream_stats["client_first_byte_ms_total"] += timings["first_byte_ms"]
+        stream_stats["client_total_ms_total"] += timings["total_ms"]
+        if "first_token_ms" in timings:
+            stream_stats["client_token_reports"] += 1
+            stream_stats["client_first_token_ms_total"] += timings["first_token_ms"]
+    return "", 204
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    """Answers many questions concurrently and streams one JSON line per result, then a summary line."""
+    data = request.get_json()
+    questions = data.get("questions") if isinstance(data, dict) else None
+    if not isinstance(questions, list) or not questions:
+        return jsonify({"error": "'questions' must be a non-empty list."}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({"error": f"A batch can hold at most {BATCH_MAX_QUESTIONS} questions."}), 400
+
+    # Batch sessions live only for the batch, so they never evict interactive users from the
+    # shared store: each conversation gets one, and each standalone question a throwaway one.
+    batch_sessions = {}
+    batch_sessions_lock = threading.Lock()
+    def answer(question, conversation):
+        if conversation is None:
+            return answer_in_session(question, Session(new_session_id()))
+        with batch_sessions_lock:
+            session = batch_sessions.setdefault(conversation, Session(new_session_id()))
+        return answer_in_session(question, session)
+
+    try:
+        max_workers = min(int(data.get("max_workers", BATCH_WORKERS)), BATCH_WORKERS)
+        results = run_batch(questions, answer, max_workers)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
 
-    agent_steps = ""
-    if "intermediate_steps" in result:
-        for action, observation in result["intermediate_steps"]:
-            agent_steps += f"Tool Used: {action.tool}\n"
-            tool_input_str = str(action.tool_input).replace('\n', ' ')
-            agent_steps += f"Tool Input: {tool_input_str}\n\n"
+    def lines():
+        for result in results:
+            yield json.dumps(result) + "\n"
 
-    if not agent_steps:
-        agent_steps = "No tools were used for this response."
+    return Response(stream_with_context(lines()), mimetype="application/x-ndjson",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-    response_payload = {
-        "agent_steps": agent_steps.strip(),
-        "final_response": final_response
-    }
+@app.route('/_ah/warmup')
+def warmup():
+    get_agent_executor()
+    get_catalog(db)
+    return "", 200
 
-    chat_history.append(HumanMessage(content=user_message))
-    chat_history.append(AIMessage(content=final_response))
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Per-stage request timings (prompt build, LLM, tool, SQL execute, serialize) in Prometheus text format."""
+    return Response(metrics.prometheus_text(), mimetype="text/plain; version=0.0.4")
 
-    return jsonify(response_payload)
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    with stream_stats_lock:
+        n = stream_stats["streams"]
+        n_tokens = stream_stats["token_streams"]
+        n_client = stream_stats["client_reports"]
+        n_client_tokens = stream_stats["client_token_reports"]
+        streaming = {
+            "streams": n,
+            "server": {
+                "avg_first_progress_ms": round(stream_stats["first_progress_ms_total"] / n, 1) if n else None,
+                "avg_first_token_ms": round(stream_stats["first_token_ms_total"] / n_tokens, 1) if n_tokens else None,
+                "avg_total_ms": round(stream_stats["total_ms_total"] / n, 1) if n else None,
+            },
+            "client": {
+                "reports": n_client,
+                "avg_first_byte_ms": round(stream_stats["client_first_byte_ms_total"] / n_client, 1) if n_client else None,
+                "avg_first_token_ms": (round(stream_stats["client_first_token_ms_total"] / n_client_tokens, 1)
+                                       if n_client_tokens else None),
+                "avg_total_ms": round(stream_stats["client_total_ms_total"] / n_client, 1) if n_client else None,
+            },
+        }
+    return jsonify({**db.stats(), "answer_cache": answer_cache.stats(), "fast_path": router.stats(),
+                    "tool_steps": tool_step_stats(), "sessions": sessions.stats(), "streaming": streaming,
+                    "stages": metrics.snapshot()})
 
 if __name__ == '__main__':
     app.run(port=int(os.environ.get('PORT', 8080)), host='0.0.0.0')
\ No newline at end of file
@@ -0,0 +1,176 @@
+import os
+import json
+import math
+import queue
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from answer_cache import normalize_question
+
+BATCH_WORKERS = int(os.environ.get("AUTOQUERY_BATCH_WORKERS", 4))
+BATCH_MAX_QUESTIONS = int(os.environ.get("AUTOQUERY_BATCH_MAX_QUESTIONS", 200))
+
+# Shared by all batches so worker threads, and their pooled SQLite connections, are reused.
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ThreadPoolExecutor:
+    """Returns the shared batch pool, replacing it with a larger one if ``workers`` exceeds its size."""
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or workers > _pool_size:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool_size = max(workers, BATCH_WORKERS)
+            _pool = ThreadPoolExecutor(max_workers=_pool_size, thread_name_prefix="batch")
+        return _pool
+
+
+def parse_batch_item(item, index: int) -> dict:
+    """Accepts ``"question"`` or ``{"id", "question"|"message", "conversation"}``."""
+    if isinstance(item, str):
+        item = {"question": item}
+    if not isinstance(item, dict):
+        raise ValueError(f"Item {index} must be a string or an object.")
+    question = str(item.get("question") or item.get("message") or "").strip()
+    if not question:
+        raise ValueError(f"Item {index} has no question.")
+    conversation = item.get("conversation")
+    return {
+        "index": index,
+        "id": item.get("id", index),
+        "question": question,
+        "conversation": None if conversation is None else str(conversation),
+    }
+
+
+def read_jsonl(path: str) -> list:
+    """Reads batch items from a JSONL file; plain-text lines are taken as bare questions."""
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError:
+                items.append(line)
+    return items
+
+
+def percentile(values: list, pct: float):
+    """Nearest-rank percentile; None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+def run_batch(items: list, answer, max_workers: int = BATCH_WORKERS):
+    """Answers a batch of questions concurrently; returns a generator of result dicts in completion order.
+
+    ``answer(question, conversation)`` returns the usual response payload. Questions that
+    share a ``conversation`` run in order on one worker, so follow-ups see earlier turns;
+    separate conversations run in parallel on at most ``max_workers`` threads. Standalone
+    questions (no conversation) that normalize to the same text are answered once. The
+    last item yielded is ``{"summary": {...}}`` with throughput and latency figures.
+    Invalid items raise ValueError before anything runs.
+    """
+    parsed = [parse_batch_item(item, i) for i, item in enumerate(items)]
+
+    groups = []  # lists of items answered sequentially by one worker
+    duplicates = {}  # index of the answered item -> items sharing its result
+    conversations = {}
+    first_by_question = {}
+    for item in parsed:
+        if item["conversation"] is not None:
+            if item["conversation"] not in conversations:
+                conversations[item["conversation"]] = []
+                groups.append(conversations[item["conversation"]])
+            conversations[item["conversation"]].append(item)
+            continue
+        key = normalize_question(item["question"])
+        if key in first_by_question:
+            duplicates.setdefault(first_by_question[key], []).append(item)
+            continue
+        first_by_question[key] = item["index"]
+        groups.append([item])
+
+    results = queue.Queue()
+    pending_groups = queue.Queue()
+    for group in groups:
+        pending_groups.put(group)
+    stopped = threading.Event()
+
+    def run_group(group):
+        for item in group:
+            if stopped.is_set():
+                return
+            start = time.perf_counter()
+            try:
+                payload = answer(item["question"], item["conversation"])
+                status, error = "ok", None
+            except Exception as e:
+                logging.error(f"Batch question {item['id']} failed:", exc_info=True)
+                payload, status, error = {}, "error", str(e)
+            latency_ms = round((time.perf_counter() - start) * 1000, 1)
+            result = {"id": item["id"], "index": item["index"], "question": item["question"], "status": status,
+                      "final_response": payload.get("final_response"), "agent_steps": payload.get("agent_steps"),
+                      "latency_ms": latency_ms}
+            if error:
+                result["error"] = error
+            results.put(result)
+            for dup in duplicates.get(item["index"], []):
+                results.put({**result, "id": dup["id"], "index": dup["index"], "question": dup["question"],
+                             "duplicate_of": item["id"], "latency_ms": 0.0})
+
+    def run_groups():
+        while not stopped.is_set():
+            try:
+                group = pending_groups.get_nowait()
+            except queue.Empty:
+                return
+            run_group(group)
+
+    workers = max(1, min(max_workers, len(groups)))
+
+    def stream():
+        started_at = time.perf_counter()
+        pool = _get_pool(workers)
+        try:
+            # ``workers`` runners share the batch's groups, so one batch never uses more threads than that.
+            for _ in range(workers):
+                pool.submit(run_groups)
+            latencies = []
+            errors = 0
+            for _ in range(len(parsed)):
+                result = results.get()
+                if "duplicate_of" not in result:
+                    latencies.append(result["latency_ms"])
+                errors += result["status"] != "ok"
+                yield result
+        finally:
+            # If the consumer stops early (client disconnect), questions not yet started are dropped.
+            stopped.set()
+
+        wall_s = time.perf_counter() - started_at
+        summary = {
+            "questions": len(parsed),
+            "answered": len(latencies),
+            "deduplicated": len(parsed) - len(latencies),
+            "errors": errors,
+            "workers": workers,
+            "wall_seconds": round(wall_s, 3),
+            "questions_per_second": round(len(parsed) / wall_s, 2) if wall_s else None,
+            "latency_ms_p50": percentile(latencies, 50),
+            "latency_ms_p95": percentile(latencies, 95),
+            "latency_ms_max": max(latencies, default=None),
+        }
+        logging.info(f"Batch finished: {summary}")
+        yield {"summary": summary}
+
+    return stream()
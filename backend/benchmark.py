@@ -0,0 +1,277 @@
+"""Offline end-to-end benchmark: the Flask app, a synthetic database and a scripted stand-in for Gemini.
+
+    python benchmark.py --ads 50000 --threads 1,2,4,8 --requests 60 --llm-latency-ms 150
+
+Every request goes through POST /api/chat exactly as in production (answer cache, fast path,
+agent, tools, SQL); only the chat model is replaced by ScriptedChatModel, which replays the
+recorded tool calls below for the README example prompts. Reports p50/p95/p99 latency and
+throughput per thread count, plus per-stage timings from the same tracing that backs /metrics.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from prompts import BENCHMARK_QUESTIONS
+
+# (maker, maker id, [models]) for the synthetic database; covers every entity the transcripts use.
+SYNTHETIC_MAKERS = [
+    ("Ford", 29, ["Fiesta", "Focus", "F150", "Kuga", "Mondeo", "Puma"]),
+    ("BMW", 8, ["3 Series", "5 Series", "X1", "X3", "X5", "i3"]),
+    ("Toyota", 95, ["Corolla", "Yaris", "RAV4", "Prius", "Aygo"]),
+    ("Vauxhall", 97, ["Corsa", "Astra", "Insignia", "Mokka"]),
+    ("Volkswagen", 99, ["Golf", "Polo", "Passat", "Tiguan"]),
+    ("Audi", 7, ["A3", "A4", "Q5", "TT"]),
+    ("Land Rover", 53, ["Range Rover", "Discovery", "Defender"]),
+    ("Nissan", 69, ["Qashqai", "Juke", "Micra", "Leaf"]),
+]
+SYNTHETIC_COLORS = ["Black", "White", "Silver", "Grey", "Blue", "Red", "Green", "Orange"]
+SYNTHETIC_BODYTYPES = ["Hatchback", "Saloon", "SUV", "Estate", "Coupe", "Convertible", "MPV"]
+SALES_YEARS = [str(year) for year in range(2020, 2000, -1)]
+
+# Tool calls recorded from agent runs on the README example prompts. Each step is the list of
+# tool calls the model emitted in one turn; "answer" is its final message.
+TRANSCRIPTS = {
+    "What was the top selling car in 2015?": {
+        "steps": [[("execute_sql", {"query": 'SELECT Maker, Genmodel, "2015" FROM sales_table ORDER BY "2015" DESC LIMIT 1'})]],
+        "answer": "The top selling car in 2015 was the one with the most units in the sales data.",
+    },
+    "What car had the largest engine size?": {
+        "steps": [[("execute_sql", {"query": "SELECT Maker, Genmodel, Engin_size FROM vehicle_ads "
+                                             "ORDER BY Engin_size DESC LIMIT 1"})]],
+        "answer": "The car with the largest engine size in the listings is shown above.",
+    },
+    "Which car has the highest top speed?": {
+        "steps": [[("execute_sql", {"query": "SELECT Maker, Genmodel, Top_speed FROM vehicle_ads "
+                                             "ORDER BY Top_speed DESC LIMIT 1"})]],
+        "answer": "The car with the highest top speed in the listings is shown above.",
+    },
+    "Show me red Ford Fiesta cars registered after 2018": {
+        "steps": [
+            [("get_distinct_values", {"table_name": "vehicle_ads", "column_name": "Color", "search": "red"}),
+             ("get_distinct_values", {"table_name": "vehicle_ads", "column_name": "Genmodel", "search": "Fiesta"})],
+            [("execute_sql", {"query": "SELECT Maker, Genmodel, Color, Reg_year, Price, Runned_Miles FROM vehicle_ads "
+                                       "WHERE UPPER(Color) = UPPER('Red') AND UPPER(Genmodel) = UPPER('Fiesta') "
+                                       "AND Reg_year > 2018"})],
+        ],
+        "answer": "Here are the red Ford Fiestas registered after 2018.",
+    },
+    "List BMW cars registered in 2020 with less than 10000 miles": {
+        "steps": [[("execute_sql", {"query": "SELECT DISTINCT v.Genmodel, v.Price, v.Runned_Miles FROM vehicle_ads v "
+                                             "JOIN basic_table b ON v.Genmodel_ID = b.Genmodel_ID "
+                                             "WHERE UPPER(b.Automaker) = UPPER('BMW') AND v.Reg_year = 2020 "
+                                             "AND v.Runned_Miles < 10000"})]],
+        "answer": "These BMW cars were registered in 2020 with under 10,000 miles.",
+    },
+    "Find cars with an automatic gearbox and more than 200 engine power": {
+        "steps": [
+            [("get_distinct_values", {"table_name": "vehicle_ads", "column_name": "Gearbox"})],
+            [("execute_sql", {"query": "SELECT Maker, Genmodel, Engine_power, Price FROM vehicle_ads "
+                                       "WHERE UPPER(Gearbox) = UPPER('Automatic') AND Engine_power > 200 "
+                                       "ORDER BY Engine_power DESC LIMIT 50"})],
+        ],
+        "answer": "These automatic cars have more than 200 engine power.",
+    },
+    "What was the entry price for a Ford Focus in 2019?": {
+        "steps": [[("execute_sql", {"query": "SELECT p.Entry_price FROM price_table p "
+                                             "JOIN basic_table b ON p.Genmodel_ID = b.Genmodel_ID "
+                                             "WHERE UPPER(b.Automaker) = UPPER('Ford') AND UPPER(p.Genmodel) = "
+                                             "UPPER('Focus') AND p.Year = 2019"})]],
+        "answer": "The entry price for a 2019 Ford Focus is shown above.",
+    },
+    "Show sales data for the Ford F150 in 2016": {
+        "steps": [
+            [("get_table_schema", {"table_name": "sales_table"})],
+            [("execute_sql", {"query": 'SELECT Maker, Genmodel, "2016" FROM sales_table '
+                                       "WHERE UPPER(Genmodel) = UPPER('F150')"})],
+        ],
+        "answer": "Here are the 2016 sales for the Ford F150.",
+    },
+    "List the top selling cars for 2018 and 2019": {
+        "steps": [[("execute_sql", {"query": "SELECT Year, Maker, Genmodel, Units FROM sales_by_year "
+                                             "WHERE Year IN (2018, 2019) ORDER BY Year, Units DESC LIMIT 10"})]],
+        "answer": "Here are the top selling cars for 2018 and 2019.",
+    },
+    "What data do you have for the 'CyberTruck' model?": {
+        "steps": [[("get_distinct_values", {"table_name": "basic_table", "column_name": "Genmodel",
+                                            "search": "CyberTruck"})]],
+        "answer": "I don't have any data for a model called CyberTruck.",
+    },
+}
+FALLBACK_ANSWER = "I can only replay the recorded benchmark questions."
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Deterministic chat model that replays TRANSCRIPTS, sleeping ``latency_ms`` per call like a remote LLM."""
+
+    transcripts: dict = TRANSCRIPTS
+    latency_ms: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        last_human = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+        question = messages[last_human].content
+        step = sum(1 for m in messages[last_human + 1:] if isinstance(m, AIMessage) and m.tool_calls)
+        transcript = self.transcripts.get(question, {"steps": [], "answer": FALLBACK_ANSWER})
+        if step < len(transcript["steps"]):
+            calls = [{"name": name, "args": args, "id": f"call_{step}_{i}", "type": "tool_call"}
+                     for i, (name, args) in enumerate(transcript["steps"][step])]
+            message = AIMessage(content="", tool_calls=calls)
+        else:
+            message = AIMessage(content=transcript["answer"])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def _write_csv(path, header, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def generate_synthetic_db(db_path: str, n_ads: int = 50_000, seed: int = 7):
+    """Writes synthetic CSVs shaped like tables_V2.0 and builds ``db_path`` from them with create_database."""
+    import create_database
+
+    rng = random.Random(seed)
+    models = [(maker, maker_id, f"{maker_id}_{i}", model)
+              for maker, maker_id, names in SYNTHETIC_MAKERS for i, model in enumerate(names, 1)]
+    with tempfile.TemporaryDirectory() as csv_dir:
+        paths = {name: os.path.join(csv_dir, f"{name}.csv")
+                 for name in ("basic_table", "price_table", "sales_table", "trim_table", "vehicle_ads")}
+        _write_csv(paths["basic_table"], ["Automaker", "Automaker_ID", "Genmodel", "Genmodel_ID"],
+                   [(maker, maker_id, model, gid) for maker, maker_id, gid, model in models])
+        _write_csv(paths["price_table"], ["Maker", "Genmodel", "Genmodel_ID", "Year", "Entry_price"],
+                   [(maker, model, gid, year, rng.randint(9_000, 80_000))
+                    for maker, _, gid, model in models for year in range(2010, 2021)])
+        _write_csv(paths["sales_table"], ["Maker", "Genmodel", "Genmodel_ID"] + SALES_YEARS,
+                   [(maker, model, gid, *[rng.randint(0, 120_000) for _ in SALES_YEARS])
+                    for maker, _, gid, model in models])
+        _write_csv(paths["trim_table"], ["Genmodel_ID", "Maker", "Genmodel", "Trim", "Year", "Price",
+                                         "Gas_emission", "Fuel_type", "Engine_size"],
+                   [(gid, maker, model, trim, year, rng.randint(10_000, 90_000), rng.randint(0, 250),
+                     rng.choice(["Petrol", "Diesel", "Electric"]), rng.choice([999, 1498, 1998, 2993]))
+                    for maker, _, gid, model in models for trim in ("SE", "Sport", "Titanium")
+                    for year in range(2014, 2021)])
+        ads = []
+        for _ in range(n_ads):
+            maker, _, gid, model = rng.choice(models)
+            reg_year = rng.randint(2000, 2020)
+            ads.append((maker, model, gid, rng.randint(2018, 2021), rng.randint(1, 12), rng.choice(SYNTHETIC_COLORS),
+                        reg_year, rng.choice(SYNTHETIC_BODYTYPES), rng.randint(0, 150_000),
+                        rng.choice([1.0, 1.2, 1.6, 2.0, 3.0, 4.4]), rng.choice(["Manual", "Automatic"]),
+                        rng.choice(["Petrol", "Diesel", "Hybrid"]), rng.randint(500, 90_000),
+                        round(rng.uniform(60, 500), 1), rng.randint(2400, 3100), rng.randint(1400, 1900),
+                        rng.randint(1650, 2100), rng.randint(3600, 5200), round(rng.uniform(20, 80), 1),
+                        round(rng.uniform(90, 190), 1), rng.choice([2, 4, 5, 7]), rng.choice([3, 5])))
+        _write_csv(paths["vehicle_ads"], [name for name, _ in create_database.TABLE_SCHEMAS["vehicle_ads"]["columns"]], ads)
+
+        mapping = {paths[name]: name for name in paths}
+        create_database.create_db_and_get_schema(db_path, mapping, print_schema=False)
+    if not os.path.exists(db_path):
+        raise RuntimeError(f"Synthetic database build failed: {db_path}")
+
+
+def run_load(app_module, questions, threads: int, requests: int) -> dict:
+    """Sends ``requests`` POST /api/chat calls from ``threads`` threads; returns latency and throughput."""
+    from batch import percentile
+
+    def one(i):
+        client = app_module.app.test_client()
+        start = time.perf_counter()
+        response = client.post("/api/chat", json={"message": questions[i % len(questions)]})
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return (time.perf_counter() - start) * 1000
+
+    app_module.metrics.reset()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(one, range(requests)))
+    wall_s = time.perf_counter() - start
+    return {
+        "threads": threads,
+        "requests": requests,
+        "wall_seconds": round(wall_s, 3),
+        "requests_per_second": round(requests / wall_s, 2),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "stages": app_module.metrics.snapshot(),
+    }
+
+
+def print_report(results):
+    print(f"\n{'threads':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        print(f"{r['threads']:>7} {r['requests_per_second']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8}")
+    for r in results:
+        print(f"\nPer-stage time per request, {r['threads']} thread(s) (mean / p95 ms, requests that hit the stage):")
+        for name, s in r["stages"].items():
+            print(f"  {name:<12} {s['mean_ms']:>9.2f} / {s['p95_ms']:>9.2f}  (n={s['count']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ads", type=int, default=50_000, help="vehicle_ads rows in the synthetic database")
+    parser.add_argument("--db", help="reuse or write the synthetic database here (default: a temp file)")
+    parser.add_argument("--threads", default="1,2,4,8", help="comma-separated thread counts")
+    parser.add_argument("--requests", type=int, default=60, help="requests per thread count")
+    parser.add_argument("--llm-latency-ms", type=float, default=150.0, help="simulated latency of each LLM call")
+    parser.add_argument("--warm", action="store_true", help="keep the SQL and answer caches enabled")
+    parser.add_argument("--no-fast-path", action="store_true", help="send template questions to the agent too")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="autoquery-bench-"), "autoquery_data.db")
+    if not os.path.exists(db_path):
+        start = time.perf_counter()
+        generate_synthetic_db(db_path, args.ads)
+        print(f"Built synthetic database ({args.ads} ads) in {time.perf_counter() - start:.1f} s: {db_path}",
+              file=sys.stderr)
+
+    # Module-level configuration is read at import time, so it is set before the app (or any
+    # module reading AUTOQUERY_* settings) is imported.
+    os.environ["AUTOQUERY_DB_PATH"] = db_path
+    os.environ.setdefault("AUTOQUERY_DB_IN_MEMORY", "1")
+    os.environ["AUTOQUERY_LLM_REQUESTS_PER_SECOND"] = "0"
+    if not args.warm:
+        os.environ["AUTOQUERY_SQL_CACHE_MB"] = "0"
+        os.environ["AUTOQUERY_SQL_CACHE_DIR"] = ""
+        os.environ["AUTOQUERY_ANSWER_CACHE_SIZE"] = "0"
+    import app as app_module
+    from agents import create_sql_agent
+
+    app_module.agent_executor = create_sql_agent(llm=ScriptedChatModel(latency_ms=args.llm_latency_ms))
+    app_module.agent_executor.verbose = False
+    if args.no_fast_path:
+        app_module.router.route = lambda question: None
+
+    # One untimed pass loads the snapshot, catalogs and schema caches, as a warmed-up instance would have.
+    run_load(app_module, BENCHMARK_QUESTIONS, 1, len(BENCHMARK_QUESTIONS))
+    results = [run_load(app_module, BENCHMARK_QUESTIONS, int(n), args.requests) for n in args.threads.split(",")]
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import pandas as pd
 import sqlite3
 import os
 import logging
+from value_catalog import normalize_name
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'tables_V2.0')
 DB_PATH = os.path.join(os.path.dirname(__file__), 'autoquery_data.db')
@@ -14,48 +15,372 @@ TABLE_MAPPING = {
     os.path.join(DATA_DIR, "vehicle_ads.csv"): "vehicle_ads"
 }
 
-def create_db_and_get_schema():
-    if os.path.exists(DB_PATH):
-        logging.info(f"Database file '{DB_PATH}' already exists. Deleting it to rebuild.")
-        os.remove(DB_PATH)
+SALES_YEARS = [str(year) for year in range(2020, 2000, -1)]
+
+# Declared column types and primary keys for each table. Columns found in a CSV but
+# not listed here are kept with a type inferred from the data.
+TABLE_SCHEMAS = {
+    "basic_table": {
+        "columns": [("Automaker", "TEXT"), ("Automaker_ID", "INTEGER"), ("Genmodel", "TEXT"),
+                    ("Genmodel_ID", "TEXT")],
+        "primary_key": ("Genmodel_ID",),
+    },
+    "price_table": {
+        "columns": [("Maker", "TEXT"), ("Genmodel", "TEXT"), ("Genmodel_ID", "TEXT"), ("Year", "INTEGER"),
+                    ("Entry_price", "INTEGER")],
+        "primary_key": None,
+    },
+    "sales_table": {
+        "columns": [("Maker", "TEXT"), ("Genmodel", "TEXT"), ("Genmodel_ID", "TEXT")]
+                   + [(year, "INTEGER") for year in SALES_YEARS],
+        "primary_key": ("Genmodel_ID",),
+    },
+    "trim_table": {
+        "columns": [("Genmodel_ID", "TEXT"), ("Maker", "TEXT"), ("Genmodel", "TEXT"), ("Trim", "TEXT"),
+                    ("Year", "INTEGER"), ("Price", "INTEGER"), ("Gas_emission", "INTEGER"),
+                    ("Fuel_type", "TEXT"), ("Engine_size", "INTEGER")],
+        "primary_key": None,
+    },
+    "vehicle_ads": {
+        "columns": [("Maker", "TEXT"), ("Genmodel", "TEXT"), ("Genmodel_ID", "TEXT"), ("Adv_year", "INTEGER"),
+                    ("Adv_month", "INTEGER"), ("Color", "TEXT"), ("Reg_year", "INTEGER"), ("Bodytype", "TEXT"),
+                    ("Runned_Miles", "INTEGER"), ("Engin_size", "REAL"), ("Gearbox", "TEXT"),
+                    ("Fuel_type", "TEXT"), ("Price", "INTEGER"), ("Engine_power", "REAL"),
+                    ("Wheelbase", "REAL"), ("Height", "REAL"), ("Width", "REAL"), ("Length", "REAL"),
+                    ("Average_mpg", "REAL"), ("Top_speed", "REAL"), ("Seat_num", "INTEGER"),
+                    ("Door_num", "INTEGER")],
+        "primary_key": None,
+    },
+}
+
+# (index name, table, indexed expressions). Genmodel_ID is the join key the prompt
+# requires for every maker filter; the UPPER(...) expression indexes match the
+# case-insensitive comparisons the prompt mandates for string filters.
+INDEXES = [
+    ("idx_basic_upper_automaker", "basic_table", "UPPER(Automaker)"),
+    ("idx_basic_upper_genmodel", "basic_table", "UPPER(Genmodel)"),
+    ("idx_price_genmodel_id_year", "price_table", "Genmodel_ID, Year"),
+    ("idx_price_upper_genmodel", "price_table", "UPPER(Genmodel)"),
+    ("idx_sales_upper_genmodel", "sales_table", "UPPER(Genmodel)"),
+    ("idx_trim_genmodel_id", "trim_table", "Genmodel_ID"),
+    ("idx_trim_upper_genmodel", "trim_table", "UPPER(Genmodel)"),
+    ("idx_ads_genmodel_id", "vehicle_ads", "Genmodel_ID"),
+    ("idx_ads_price", "vehicle_ads", "Price"),
+    ("idx_ads_reg_year", "vehicle_ads", "Reg_year"),
+    ("idx_ads_adv_year", "vehicle_ads", "Adv_year"),
+    ("idx_ads_upper_maker", "vehicle_ads", "UPPER(Maker)"),
+    ("idx_ads_upper_genmodel", "vehicle_ads", "UPPER(Genmodel)"),
+    ("idx_ads_upper_color", "vehicle_ads", "UPPER(Color)"),
+    ("idx_ads_upper_bodytype", "vehicle_ads", "UPPER(Bodytype)"),
+    ("idx_sales_by_year_year_units", "sales_by_year", "Year, Units DESC"),
+    ("idx_sales_by_year_upper_genmodel", "sales_by_year", "UPPER(Genmodel)"),
+    ("idx_model_stats_upper_genmodel", "model_listing_stats", "UPPER(Genmodel)"),
+    ("idx_maker_stats_upper_automaker", "maker_listing_stats", "UPPER(Automaker)"),
+]
+
+# Tables derived from the loaded CSVs: a long-format copy of sales_table and
+# precomputed vehicle_ads aggregates, so cross-year and aggregate questions read a
+# few hundred rows instead of scanning every listing.
+DERIVED_TABLES = {
+    "sales_by_year": """
+        CREATE TABLE sales_by_year (
+            Genmodel_ID TEXT NOT NULL,
+            Maker TEXT,
+            Genmodel TEXT,
+            Year INTEGER NOT NULL,
+            Units INTEGER NOT NULL,
+            PRIMARY KEY (Genmodel_ID, Year)
+        )""",
+    "model_listing_stats": """
+        CREATE TABLE model_listing_stats (
+            Genmodel_ID TEXT PRIMARY KEY,
+            Maker TEXT,
+            Genmodel TEXT,
+            Listing_count INTEGER,
+            Avg_price REAL,
+            Min_price INTEGER,
+            Max_price INTEGER,
+            Avg_miles REAL,
+            Min_reg_year INTEGER,
+            Max_reg_year INTEGER
+        )""",
+    "maker_listing_stats": """
+        CREATE TABLE maker_listing_stats (
+            Automaker TEXT PRIMARY KEY,
+            Model_count INTEGER,
+            Listing_count INTEGER,
+            Avg_price REAL,
+            Min_price INTEGER,
+            Max_price INTEGER,
+            Avg_miles REAL
+        )""",
+    "year_listing_stats": """
+        CREATE TABLE year_listing_stats (
+            Reg_year INTEGER PRIMARY KEY,
+            Listing_count INTEGER,
+            Avg_price REAL,
+            Min_price INTEGER,
+            Max_price INTEGER,
+            Avg_miles REAL
+        )""",
+}
+
+PAGE_SIZE = 8192
+
+# Shapes of the queries the agent generates most often; their plans are printed after the build.
+REPRESENTATIVE_QUERIES = [
+    'SELECT Genmodel, "2015" FROM sales_table ORDER BY "2015" DESC LIMIT 1',
+    "SELECT DISTINCT v.Genmodel, v.Price FROM vehicle_ads v JOIN basic_table b ON v.Genmodel_ID = b.Genmodel_ID "
+    "WHERE UPPER(b.Automaker) = UPPER('BMW') AND v.Reg_year = 2020 AND v.Runned_Miles < 10000",
+    "SELECT * FROM vehicle_ads WHERE UPPER(Color) = UPPER('Red') AND UPPER(Genmodel) = UPPER('Fiesta') "
+    "AND Reg_year > 2018",
+    "SELECT p.Entry_price FROM price_table p JOIN basic_table b ON p.Genmodel_ID = b.Genmodel_ID "
+    "WHERE UPPER(b.Automaker) = UPPER('Ford') AND UPPER(p.Genmodel) = UPPER('Focus') AND p.Year = 2019",
+    "SELECT Maker, Genmodel, Engin_size FROM vehicle_ads ORDER BY Engin_size DESC LIMIT 1",
+    "SELECT Year, Maker, Genmodel, Units FROM sales_by_year WHERE Year IN (2018, 2019) ORDER BY Units DESC LIMIT 10",
+    "SELECT Automaker, Listing_count, Avg_price FROM maker_listing_stats ORDER BY Listing_count DESC LIMIT 5",
+    "SELECT Bodytype, COUNT(*) AS count FROM vehicle_ads WHERE Price BETWEEN 10000 AND 20000 "
+    "GROUP BY Bodytype ORDER BY count DESC",
+    "SELECT t.Trim, t.Price FROM trim_table t JOIN basic_table b ON t.Genmodel_ID = b.Genmodel_ID "
+    "WHERE UPPER(b.Automaker) = UPPER('Toyota') AND t.Year = 2018",
+]
+
+
+def _sqlite_type(dtype) -> str:
+    if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+
+def load_table(conn, csv_path, table_name):
+    """Creates ``table_name`` with its declared types and primary key and loads the CSV into it."""
+    logging.info(f"Reading '{os.path.basename(csv_path)}'...")
+    df = pd.read_csv(csv_path)
+    df.columns = df.columns.str.strip()
+
+    if table_name == "sales_table":
+        for col in df.columns:
+            if col.isdigit():
+                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
+
+    schema = TABLE_SCHEMAS.get(table_name, {"columns": [], "primary_key": None})
+    declared = dict(schema["columns"])
+    missing = [name for name in declared if name not in df.columns]
+    if missing:
+        logging.warning(f"'{table_name}': declared columns missing from CSV: {missing}")
+    columns = [(name, col_type) for name, col_type in schema["columns"] if name in df.columns]
+    columns += [(name, _sqlite_type(df[name].dtype)) for name in df.columns if name not in declared]
+
+    primary_key = schema["primary_key"]
+    if primary_key and all(name in df.columns for name in primary_key):
+        before = len(df)
+        df = df.drop_duplicates(subset=list(primary_key))
+        if len(df) != before:
+            logging.warning(f"'{table_name}': dropped {before - len(df)} rows with a duplicate primary key.")
+    else:
+        primary_key = None
+
+    column_defs = [f'"{name}" {col_type}' for name, col_type in columns]
+    if primary_key:
+        column_defs.append("PRIMARY KEY (" + ", ".join(f'"{name}"' for name in primary_key) + ")")
+    conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+    conn.execute(f'CREATE TABLE "{table_name}" (\n    ' + ",\n    ".join(column_defs) + "\n)")
+
+    df = df[[name for name, _ in columns]]
+    df.to_sql(table_name, conn, if_exists='append', index=False, chunksize=10000)
+    conn.commit()
+    logging.info(f"Successfully created table '{table_name}' ({len(df)} rows).")
+
+
+def create_indexes(conn, table_names):
+    for index_name, table_name, expressions in INDEXES:
+        if table_name not in table_names:
+            continue
+        try:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON "{table_name}" ({expressions})')
+        except sqlite3.OperationalError as e:
+            logging.warning(f"Skipping index '{index_name}': {e}")
+    conn.commit()
+    logging.info("Indexes created.")
+
+
+def print_query_plans(conn):
+    print("\n" + "="*50)
+    print("EXPLAIN QUERY PLAN FOR REPRESENTATIVE QUERIES")
+    print("="*50)
+    for query in REPRESENTATIVE_QUERIES:
+        print(f"\n{query}")
+        try:
+            for _, parent, _, detail in conn.execute(f"EXPLAIN QUERY PLAN {query}").fetchall():
+                print(f"    {'  ' if parent else ''}{detail}")
+        except sqlite3.Error as e:
+            print(f"    ERROR: {e}")
+
+
+def build_derived_tables(conn, table_names):
+    """Builds the long-format sales table and the vehicle_ads aggregate tables."""
+    created = []
+    if "sales_table" in table_names:
+        conn.execute("DROP TABLE IF EXISTS sales_by_year")
+        conn.execute(DERIVED_TABLES["sales_by_year"])
+        year_columns = {row[1] for row in conn.execute('PRAGMA table_info("sales_table")')}
+        for year in SALES_YEARS:
+            if year not in year_columns:
+                continue
+            conn.execute(
+                f'INSERT OR IGNORE INTO sales_by_year (Genmodel_ID, Maker, Genmodel, Year, Units) '
+                f'SELECT Genmodel_ID, Maker, Genmodel, {int(year)}, COALESCE("{year}", 0) FROM sales_table '
+                f'WHERE Genmodel_ID IS NOT NULL'
+            )
+        created.append("sales_by_year")
+
+    if "vehicle_ads" in table_names:
+        for table_name in ("model_listing_stats", "year_listing_stats"):
+            conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+            conn.execute(DERIVED_TABLES[table_name])
+        conn.execute("""
+            INSERT INTO model_listing_stats
+            SELECT Genmodel_ID, MAX(Maker), MAX(Genmodel), COUNT(*), AVG(Price), MIN(Price), MAX(Price),
+                   AVG(Runned_Miles), MIN(Reg_year), MAX(Reg_year)
+            FROM vehicle_ads WHERE Genmodel_ID IS NOT NULL GROUP BY Genmodel_ID""")
+        conn.execute("""
+            INSERT INTO year_listing_stats
+            SELECT Reg_year, COUNT(*), AVG(Price), MIN(Price), MAX(Price), AVG(Runned_Miles)
+            FROM vehicle_ads WHERE Reg_year IS NOT NULL GROUP BY Reg_year""")
+        created += ["model_listing_stats", "year_listing_stats"]
+
+        if "basic_table" in table_names:
+            conn.execute("DROP TABLE IF EXISTS maker_listing_stats")
+            conn.execute(DERIVED_TABLES["maker_listing_stats"])
+            conn.execute("""
+                INSERT INTO maker_listing_stats
+                SELECT b.Automaker, COUNT(DISTINCT v.Genmodel_ID), COUNT(*), AVG(v.Price), MIN(v.Price),
+                       MAX(v.Price), AVG(v.Runned_Miles)
+                FROM vehicle_ads v JOIN basic_table b ON v.Genmodel_ID = b.Genmodel_ID
+                WHERE b.Automaker IS NOT NULL GROUP BY b.Automaker""")
+            created.append("maker_listing_stats")
+
+    conn.commit()
+    logging.info(f"Derived tables built: {created}")
+    return created
+
+
+# Entity kinds for the normalized-name index, and the text columns that feed them.
+CATALOG_ENTITY_COLUMNS = {
+    "maker": [("basic_table", "Automaker"), ("vehicle_ads", "Maker"), ("price_table", "Maker"),
+              ("sales_table", "Maker"), ("trim_table", "Maker")],
+    "model": [("basic_table", "Genmodel"), ("vehicle_ads", "Genmodel"), ("price_table", "Genmodel"),
+              ("sales_table", "Genmodel"), ("trim_table", "Genmodel")],
+    "color": [("vehicle_ads", "Color")],
+    "bodytype": [("vehicle_ads", "Bodytype")],
+}
+CATALOG_MAX_VALUES = 5000
+
+
+def build_value_catalog(conn, table_names):
+    """Builds the value catalog served by the `get_distinct_values` tool.
+
+    For every text column: its cardinality and non-null count (`value_catalog_columns`) and
+    its values ranked by frequency with a normalized name (`value_catalog`). Makers, models,
+    colors and body types are also merged into a normalized-name index (`value_catalog_entities`).
+    """
+    conn.executescript("""
+        DROP TABLE IF EXISTS value_catalog_columns;
+        DROP TABLE IF EXISTS value_catalog;
+        DROP TABLE IF EXISTS value_catalog_entities;
+        CREATE TABLE value_catalog_columns (
+            table_name TEXT NOT NULL, column_name TEXT NOT NULL,
+            cardinality INTEGER NOT NULL, non_null_count INTEGER NOT NULL,
+            PRIMARY KEY (table_name, column_name));
+        CREATE TABLE value_catalog (
+            table_name TEXT NOT NULL, column_name TEXT NOT NULL, value TEXT NOT NULL,
+            frequency INTEGER NOT NULL, rank INTEGER NOT NULL, normalized TEXT NOT NULL,
+            PRIMARY KEY (table_name, column_name, value));
+        CREATE TABLE value_catalog_entities (
+            kind TEXT NOT NULL, normalized TEXT NOT NULL, value TEXT NOT NULL, frequency INTEGER NOT NULL,
+            PRIMARY KEY (kind, normalized, value));
+    """)
+
+    for table_name in table_names:
+        for _, column_name, *_ in conn.execute(f'PRAGMA table_info("{table_name}")').fetchall():
+            col = f'"{column_name}"'
+            text_rows = conn.execute(
+                f'SELECT COUNT(*) FROM "{table_name}" WHERE typeof({col}) = \'text\''
+            ).fetchone()[0]
+            if not text_rows:
+                continue
+            cardinality, non_null = conn.execute(
+                f'SELECT COUNT(DISTINCT {col}), COUNT({col}) FROM "{table_name}"'
+            ).fetchone()
+            conn.execute("INSERT INTO value_catalog_columns VALUES (?, ?, ?, ?)",
+                         (table_name, column_name, cardinality, non_null))
+            ranked = conn.execute(
+                f'SELECT CAST({col} AS TEXT), COUNT(*) AS n FROM "{table_name}" WHERE {col} IS NOT NULL '
+                f'GROUP BY {col} ORDER BY n DESC, {col} LIMIT {CATALOG_MAX_VALUES}'
+            ).fetchall()
+            conn.executemany(
+                "INSERT OR IGNORE INTO value_catalog VALUES (?, ?, ?, ?, ?, ?)",
+                [(table_name, column_name, value, n, rank, normalize_name(value))
+                 for rank, (value, n) in enumerate(ranked, start=1)],
+            )
+
+    for kind, columns in CATALOG_ENTITY_COLUMNS.items():
+        for table_name, column_name in columns:
+            conn.execute(
+                "INSERT INTO value_catalog_entities (kind, normalized, value, frequency) "
+                "SELECT ?, normalized, value, frequency FROM value_catalog "
+                "WHERE table_name = ? AND column_name = ? AND normalized != '' "
+                "ON CONFLICT (kind, normalized, value) DO UPDATE SET frequency = frequency + excluded.frequency",
+                (kind, table_name, column_name),
+            )
+    conn.commit()
+    logging.info("Value catalog built.")
+
+
+def create_db_and_get_schema(db_path=DB_PATH, table_mapping=TABLE_MAPPING, print_schema=True):
+    if os.path.exists(db_path):
+        logging.info(f"Database file '{db_path}' already exists. Deleting it to rebuild.")
+        os.remove(db_path)
 
     all_tables_created = []
 
     try:
-        conn = sqlite3.connect(DB_PATH)
-        logging.info(f"Successfully created SQLite database at '{DB_PATH}'")
+        conn = sqlite3.connect(db_path)
+        conn.execute(f"PRAGMA page_size = {PAGE_SIZE}")
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        logging.info(f"Successfully created SQLite database at '{db_path}'")
 
-        for csv_path, table_name in TABLE_MAPPING.items():
+        for csv_path, table_name in table_mapping.items():
             if os.path.exists(csv_path):
-                logging.info(f"Reading '{os.path.basename(csv_path)}'...")
-                df = pd.read_csv(csv_path)
-                df.columns = df.columns.str.strip()
-
-                if table_name == "sales_table":
-                    for col in df.columns:
-                        if col.isdigit():
-                            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
-
-                df.to_sql(table_name, conn, if_exists='replace', index=False)
+                load_table(conn, csv_path, table_name)
                 all_tables_created.append(table_name)
-                logging.info(f"Successfully created table '{table_name}'.")
             else:
                 logging.warning(f"CSV file not found, skipping: '{csv_path}'")
 
-        print("\n" + "="*50)
-        print("DATABASE SCHEMA FOR PROMPTS.PY")
-        print("="*50 + "\n")
-
-        for table_name in sorted(all_tables_created):
-            print(f"        `{table_name}`: Description of the table.")
-            df = pd.read_sql_query(f"SELECT * FROM {table_name} LIMIT 1", conn)
-            schema = pd.io.sql.get_schema(df, table_name)
-            columns = [line.strip().split(" ") for line in schema.split('\n') if "CREATE TABLE" not in line and ")" not in line and line.strip() != ""]
-            for col_info in columns:
-                col_name = col_info[0].replace('"', '')
-                col_type = col_info[1]
-                print(f"            `{col_name}` ({col_type})")
-            print("")
+        derived_tables = build_derived_tables(conn, all_tables_created)
+        create_indexes(conn, all_tables_created + derived_tables)
+        build_value_catalog(conn, all_tables_created)
+
+        conn.execute("ANALYZE")
+        conn.commit()
+        conn.execute("VACUUM")
+        logging.info("ANALYZE and VACUUM complete.")
+
+        if print_schema:
+            print("\n" + "="*50)
+            print("DATABASE SCHEMA FOR PROMPTS.PY")
+            print("="*50 + "\n")
+
+            for table_name in sorted(all_tables_created + derived_tables):
+                print(f"        `{table_name}`: Description of the table.")
+                for _, col_name, col_type, *_ in conn.execute(f'PRAGMA table_info("{table_name}")').fetchall():
+                    print(f"            `{col_name}` ({col_type})")
+                print("")
+
+            print_query_plans(conn)
 
         conn.close()
         logging.info("Database creation complete and connection closed.")
@@ -64,4 +389,4 @@ def create_db_and_get_schema():
         logging.error(f"An error occurred during database creation: {e}", exc_info=True)
 
 if __name__ == "__main__":
-    create_db_and_get_schema()
\ No newline at end of file
+    create_db_and_get_schema()
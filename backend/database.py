@@ -1,54 +1,457 @@
 import os
+import csv
 import sqlite3
-import pandas as pd
+import threading
+import time
 import io
 import logging
+import weakref
+from collections import Counter
+from query_cache import QueryCache
+from query_guard import QueryGuard
+from tracing import stage
 
 logging.basicConfig(level=logging.INFO)
 
 
 _BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_FILENAME = "autoquery_data.db"
-DB_FILE_PATH = os.path.join(_BASE_DIR, DB_FILENAME)
+DB_FILE_PATH = os.environ.get("AUTOQUERY_DB_PATH") or os.path.join(_BASE_DIR, DB_FILENAME)
+
+# Applied once to every pooled connection when it is opened.
+CONNECTION_PRAGMAS = (
+    ("query_only", "ON"),
+    ("mmap_size", 256 * 1024 * 1024),
+    ("cache_size", -32 * 1024),  # negative value = KiB
+    ("temp_store", "MEMORY"),
+)
+IN_MEMORY_SNAPSHOT = os.environ.get("AUTOQUERY_DB_IN_MEMORY", "").lower() in ("1", "true", "yes")
+MAX_RESULT_ROWS = int(os.environ.get("AUTOQUERY_MAX_RESULT_ROWS", 200))
+MAX_RESULT_BYTES = int(os.environ.get("AUTOQUERY_MAX_RESULT_BYTES", 16 * 1024))
+FETCH_BATCH_SIZE = 100
+SUMMARY_TOP_VALUES = 5
+# Rows of an over-budget result that feed its column summary; the total row count is always exact.
+SUMMARY_MAX_ROWS = int(os.environ.get("AUTOQUERY_SUMMARY_MAX_ROWS", 20_000))
+HEALTH_CHECK_INTERVAL = 30.0  # seconds a connection may sit idle before it is pinged
+FILE_CHECK_INTERVAL = 1.0  # seconds between stat() calls on the database file
+
+
+class _ThreadConnection:
+    """A thread's pooled connection. Held only by the thread-local, so it is collected when the thread exits."""
+
+    def __init__(self, conn: sqlite3.Connection, generation: int):
+        self.conn = conn
+        self.generation = generation
+        self.last_used = time.monotonic()
+
+
+def _close_thread_connection(pool_ref, conn: sqlite3.Connection):
+    """Finalizer for a ``_ThreadConnection`` whose thread has exited."""
+    pool = pool_ref()
+    if pool is not None:
+        pool._discard(conn, thread_exit=True)
+    else:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+class ConnectionPool:
+    """Keeps one read-only SQLite connection per thread and reuses it across queries.
+
+    Connections are reopened when the database file is replaced (detected via its
+    inode, size and mtime) or when a health check on an idle connection fails, and
+    closed when their thread exits.
+
+    With ``in_memory=True`` the file is copied once into a shared-cache in-memory
+    database using the sqlite backup API, and every thread reads from that
+    snapshot instead of the file. The snapshot is reloaded when the file changes.
+    """
+
+    def __init__(self, db_path: str, in_memory: bool = False):
+        self.db_path = db_path
+        self.in_memory = in_memory
+        self._snapshot_conn = None
+        self._snapshot_uri = None
+        self._snapshot_stats = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: set[sqlite3.Connection] = set()  # open connections; each is removed when its thread exits
+        self._generation = 0
+        self._fingerprint = None
+        self._last_file_check = 0.0
+        self._stats = {
+            "acquires": 0,
+            "hits": 0,
+            "opens": 0,
+            "reopens": 0,
+            "thread_exit_closes": 0,
+            "health_check_failures": 0,
+            "wait_time_ms": 0.0,
+        }
+
+    def _file_fingerprint(self):
+        try:
+            st = os.stat(self.db_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"SQLite DB file not found: {self.db_path}")
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _current_generation(self) -> int:
+        """Returns the file generation, bumping it if the DB file changed on disk."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_file_check < FILE_CHECK_INTERVAL and self._fingerprint is not None:
+                return self._generation
+            self._last_file_check = now
+            fingerprint = self._file_fingerprint()
+            if self._fingerprint is not None and fingerprint != self._fingerprint:
+                self._generation += 1
+                logging.info(f"SQLite DB file changed on disk, reopening pooled connections: {self.db_path}")
+                if self.in_memory:
+                    self._load_snapshot()
+            self._fingerprint = fingerprint
+            return self._generation
+
+    def fingerprint(self):
+        """Returns the (inode, size, mtime) fingerprint of the DB file, refreshed at most once per FILE_CHECK_INTERVAL."""
+        self._current_generation()
+        return self._fingerprint
+
+    def _load_snapshot(self):
+        """Copies the DB file into a new shared in-memory database. Caller holds the lock."""
+        start = time.perf_counter()
+        uri = f"file:autoquery_snapshot_{id(self)}_{self._generation}?mode=memory&cache=shared"
+        snapshot = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        source = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=10)
+        try:
+            source.backup(snapshot)
+        finally:
+            source.close()
+        page_count = snapshot.execute("PRAGMA page_count").fetchone()[0]
+        page_size = snapshot.execute("PRAGMA page_size").fetchone()[0]
+
+        # Readers still attached to the previous snapshot keep it alive until they reopen.
+        previous = self._snapshot_conn
+        self._snapshot_conn = snapshot
+        self._snapshot_uri = uri
+        if previous is not None:
+            previous.close()
+
+        self._snapshot_stats = {
+            "bytes": page_count * page_size,
+            "load_ms": round((time.perf_counter() - start) * 1000, 3),
+            "loads": self._snapshot_stats.get("loads", 0) + 1,
+        }
+        logging.info(
+            f"Loaded in-memory snapshot of {self.db_path}: "
+            f"{self._snapshot_stats['bytes'] / (1024 * 1024):.1f} MiB in {self._snapshot_stats['load_ms']:.0f} ms"
+        )
+
+    def load(self):
+        """Eagerly checks the DB file and, in snapshot mode, loads it into memory."""
+        with self._lock:
+            self._fingerprint = self._file_fingerprint()
+            self._last_file_check = time.monotonic()
+            if self.in_memory and self._snapshot_conn is None:
+                self._load_snapshot()
+
+    def _open(self) -> sqlite3.Connection:
+        if self.in_memory:
+            with self._lock:
+                if self._snapshot_conn is None:
+                    self._load_snapshot()
+                uri = self._snapshot_uri
+        else:
+            uri = f"file:{self.db_path}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=10, check_same_thread=False)
+        for name, value in CONNECTION_PRAGMAS:
+            conn.execute(f"PRAGMA {name} = {value}")
+        with self._lock:
+            self._connections.add(conn)
+            self._stats["opens"] += 1
+        logging.info(f"Opened pooled SQLite connection ({'snapshot' if self.in_memory else 'read-only'}) in thread {threading.current_thread().name}")
+        return conn
+
+    def _discard(self, conn: sqlite3.Connection, thread_exit: bool = False):
+        with self._lock:
+            if thread_exit and conn in self._connections:
+                self._stats["thread_exit_closes"] += 1
+            self._connections.discard(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _healthy(self, conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error as e:
+            logging.warning(f"Pooled SQLite connection failed health check: {e}")
+            with self._lock:
+                self._stats["health_check_failures"] += 1
+            return False
+
+    def acquire(self) -> sqlite3.Connection:
+        """Returns this thread's connection, opening or reopening it if needed."""
+        start = time.perf_counter()
+        generation = self._current_generation()
+        holder = getattr(self._local, "holder", None)
+        reused = False
+
+        if holder is not None:
+            stale = holder.generation != generation
+            if stale or (time.monotonic() - holder.last_used > HEALTH_CHECK_INTERVAL and not self._healthy(holder.conn)):
+                holder.finalizer.detach()
+                self._discard(holder.conn)
+                holder = self._local.holder = None
+                if stale:
+                    with self._lock:
+                        self._stats["reopens"] += 1
+            else:
+                reused = True
+
+        if holder is None:
+            holder = _ThreadConnection(self._open(), generation)
+            holder.finalizer = weakref.finalize(holder, _close_thread_connection, weakref.ref(self), holder.conn)
+            self._local.holder = holder
+
+        holder.last_used = time.monotonic()
+        conn = holder.conn
+        with self._lock:
+            self._stats["acquires"] += 1
+            if reused:
+                self._stats["hits"] += 1
+            self._stats["wait_time_ms"] += (time.perf_counter() - start) * 1000
+        return conn
+
+    def close_all(self):
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+            self._generation += 1
+            snapshot, self._snapshot_conn = self._snapshot_conn, None
+        if snapshot is not None:
+            connections.append(snapshot)
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["open_connections"] = len(self._connections)
+            stats["mode"] = "memory" if self.in_memory else "file"
+            if self.in_memory:
+                stats["snapshot"] = dict(self._snapshot_stats)
+        stats["wait_time_ms"] = round(stats["wait_time_ms"], 3)
+        stats["hit_rate"] = round(stats["hits"] / stats["acquires"], 4) if stats["acquires"] else 0.0
+        return stats
+
+
+def _quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    return str(value)
+
 
 class Database:
-    def __init__(self):
-        self.db_path = DB_FILE_PATH
+    def __init__(
+        self,
+        db_path: str = DB_FILE_PATH,
+        in_memory: bool = IN_MEMORY_SNAPSHOT,
+        max_rows: int = MAX_RESULT_ROWS,
+        max_bytes: int = MAX_RESULT_BYTES,
+        cache: QueryCache | None = None,
+        guard: QueryGuard | None = None,
+    ):
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.cache = cache if cache is not None else QueryCache()
+        self.guard = guard if guard is not None else QueryGuard()
+        self.pool = ConnectionPool(self.db_path, in_memory=in_memory)
         logging.info(f"Database object initialized for SQLite file: {self.db_path}")
         if not os.path.exists(self.db_path):
-             
+
              logging.warning(f"Database file not found at {self.db_path} during init.")
+        elif in_memory:
+            self.pool.load()
 
     def _get_connection(self):
-        """Establishes a read-only connection to the SQLite database."""
+        """Returns the calling thread's pooled read-only connection to the SQLite database."""
         try:
-            if not os.path.exists(self.db_path):
-                 raise FileNotFoundError(f"SQLite DB file not found: {self.db_path}")
-           
-            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=10)
-            logging.info(f"Connected to SQLite DB (read-only): {self.db_path}")
-            return conn
+            return self.pool.acquire()
         except sqlite3.Error as e:
             logging.error(f"Error connecting to SQLite database {self.db_path}: {e}", exc_info=True)
             raise
 
+    def _fetch_within_budget(self, cursor: sqlite3.Cursor):
+        """Streams rows with fetchmany until the result ends or the row/byte budget is spent.
+
+        Returns ``(rows, leftover)``; ``leftover`` holds the already fetched rows past the
+        budget, or is None when the whole result fit.
+        """
+        rows = []
+        used_bytes = 0
+        while True:
+            batch = cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not batch:
+                return rows, None
+            for i, row in enumerate(batch):
+                row_bytes = sum(len(str(v)) + 1 for v in row)
+                if len(rows) >= self.max_rows or (rows and used_bytes + row_bytes > self.max_bytes):
+                    return rows, batch[i:]
+                rows.append(row)
+                used_bytes += row_bytes
+
+    def _summarize_overflow(self, conn, query: str, cursor: sqlite3.Cursor, columns: list[str],
+                            rows: list, leftover: list) -> tuple[int | None, int, list[str]]:
+        """Builds the total row count and a per-column summary for an over-budget result.
+
+        The summary is computed in one pass, reading on from the same cursor without keeping
+        rows, over at most SUMMARY_MAX_ROWS rows. If the result ends within that, the count is
+        exact; otherwise it comes from a ``COUNT(*)`` over the query, which SQLite answers
+        without decoding columns. Returns ``(total, summarized_rows, lines)``; ``total`` is
+        None when it cannot be counted (e.g. PRAGMA statements).
+        """
+        numeric = [None] * len(columns)  # decided by each column's first non-NULL value
+        lows, highs = [None] * len(columns), [None] * len(columns)
+        sums, counts = [0.0] * len(columns), [0] * len(columns)
+        top_values = [Counter() for _ in columns]
+        seen = 0
+        exhausted = False
+        batch = rows + leftover
+        while True:
+            for i, values in enumerate(zip(*batch)):
+                values = [v for v in values if v is not None]
+                if not values:
+                    continue
+                if numeric[i] is None:
+                    numeric[i] = isinstance(values[0], (int, float))
+                if numeric[i]:
+                    values = [v for v in values if isinstance(v, (int, float))]
+                    if values:
+                        lo, hi = min(values), max(values)
+                        lows[i] = lo if lows[i] is None else min(lows[i], lo)
+                        highs[i] = hi if highs[i] is None else max(highs[i], hi)
+                        sums[i] += sum(values)
+                        counts[i] += len(values)
+                else:
+                    top_values[i].update(values)
+            seen += len(batch)
+            if seen >= SUMMARY_MAX_ROWS:
+                break
+            batch = cursor.fetchmany(min(FETCH_BATCH_SIZE * 10, SUMMARY_MAX_ROWS - seen))
+            if not batch:
+                exhausted = True
+                break
+
+        total = seen if exhausted else None
+        if total is None:
+            try:
+                total = conn.execute(f"SELECT COUNT(*) FROM ({query.strip().rstrip(';')})").fetchone()[0]
+            except sqlite3.Error as e:
+                logging.debug(f"Could not count truncated result: {e}")
+
+        lines = []
+        for i, name in enumerate(columns):
+            if numeric[i] and counts[i]:
+                lines.append(f"{name}: min={_format_value(lows[i])}, max={_format_value(highs[i])}, "
+                             f"mean={_format_value(sums[i] / counts[i])}")
+            elif top_values[i]:
+                top = top_values[i].most_common(SUMMARY_TOP_VALUES)
+                lines.append(f"{name}: top values " + ", ".join(f"{v} ({n})" for v, n in top))
+        return total, seen, lines
+
     def run_query(self, query: str) -> str:
-        """Executes a SQL query against the read-only SQLite database."""
-        logging.info(f"Attempting to execute SQLite query (RO mode): {query[:500]}...")
-        conn = None
+        """Executes a SQL query against the read-only SQLite database.
+
+        Results are served from the SQL result cache when the same normalized query
+        already ran against the current DB file.
+        """
+        logging.debug(f"Attempting to execute SQLite query (RO mode): {query[:500]}...")
+        cache_key = self.cache.make_key(query, (self.pool.fingerprint(), self.max_rows, self.max_bytes))
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            logging.debug("Query served from SQL result cache.")
+            return cached
+
+        result = self._execute(self._get_connection(), query)
+        self.cache.set(cache_key, result)
+        return result
+
+    def _execute(self, conn: sqlite3.Connection, query: str) -> str:
+        """Runs the query, streaming rows from the cursor capped at ``max_rows`` rows /
+        ``max_bytes`` bytes of output. Over-budget results return the rows that fit,
+        followed by the total row count and a per-column summary of the full result.
+
+        Raises QueryRejected when the query guard refuses the plan or aborts execution.
+        """
+        with stage("sql_execute"):
+            self.guard.preflight(conn, query, self.pool.fingerprint())
+        with self.guard.limits(conn):
+            return self._execute_within_limits(conn, query)
+
+    def _execute_within_limits(self, conn: sqlite3.Connection, query: str) -> str:
+        with stage("sql_execute"):
+            cursor = conn.execute(query)
+            try:
+                columns = [d[0] for d in cursor.description] if cursor.description else []
+                rows, leftover = self._fetch_within_budget(cursor)
+                if leftover is not None:
+                    total, summarized, summary = self._summarize_overflow(
+                        conn, query, cursor, columns, rows, leftover)
+            finally:
+                cursor.close()
+        logging.debug(f"Query returned {len(rows)} rows (truncated={leftover is not None}).")
+
+        if not rows:
+            return ",".join(columns) + "\n" if columns else ""
+
+        with stage("serialize"):
+            csv_buffer = io.StringIO()
+            writer = csv.writer(csv_buffer, lineterminator="\n")
+            writer.writerow(columns)
+            writer.writerows(rows)
+            csv_output = csv_buffer.getvalue()
+        if leftover is None:
+            return csv_output
+
+        total_text = f"{total} rows" if total is not None else f"more than {len(rows)} rows"
+        covered = "the full result" if summarized == total else f"the first {summarized} rows"
+        notes = [
+            f"Result truncated: showing the first {len(rows)} of {total_text} "
+            f"(budget: {self.max_rows} rows / {self.max_bytes} bytes). "
+            "Use aggregates, filters or LIMIT for a smaller result.",
+            f"Column summary of {covered}:",
+        ] + [f"  {line}" for line in summary]
+        return csv_output + "\n".join(notes) + "\n"
+
+    def compile_error(self, query: str) -> str | None:
+        """Compiles ``query`` without running it. Returns None if it is valid, else SQLite's error text."""
         try:
-            conn = self._get_connection()
-            result_df = pd.read_sql_query(query, conn)
-            logging.info(f"Query returned {len(result_df)} rows.")
+            self._get_connection().execute(f"EXPLAIN {query}").close()
+            return None
+        except (sqlite3.Error, sqlite3.Warning) as e:
+            return str(e)
 
-            if result_df.empty:
-                return ",".join(result_df.columns) + "\n" if result_df.columns.tolist() else ""
-            else:
-                csv_buffer = io.StringIO()
-                result_df.to_csv(csv_buffer, index=False)
-                csv_output = csv_buffer.getvalue()
-                return csv_output
-        finally:
-            if conn:
-                conn.close()
-                logging.info("SQLite connection closed.")
\ No newline at end of file
+    def fetch_all(self, query: str, params=()) -> list:
+        """Runs a trusted internal query and returns raw rows, bypassing budgets and the result cache."""
+        return self._get_connection().execute(query, params).fetchall()
+
+    def stats(self) -> dict:
+        return {"pool": self.pool.stats(), "sql_cache": self.cache.stats(), "query_guard": self.guard.stats()}
+
+    def close_connection(self):
+        """Closes every pooled connection; threads transparently reopen on next use."""
+        self.pool.close_all()
+        logging.info("SQLite connection pool closed.")
@@ -0,0 +1,234 @@
+import re
+import threading
+import time
+import logging
+from value_catalog import get_catalog
+
+# Question phrase -> vehicle_ads column for "which car has the highest/largest X" questions.
+SUPERLATIVE_COLUMNS = {
+    "engine size": "Engin_size",
+    "engine": "Engin_size",
+    "top speed": "Top_speed",
+    "speed": "Top_speed",
+    "engine power": "Engine_power",
+    "horsepower": "Engine_power",
+    "power": "Engine_power",
+    "price": "Price",
+    "mileage": "Runned_Miles",
+    "miles": "Runned_Miles",
+    "mpg": "Average_mpg",
+    "average mpg": "Average_mpg",
+    "fuel economy": "Average_mpg",
+    "number of seats": "Seat_num",
+    "seats": "Seat_num",
+    "wheelbase": "Wheelbase",
+    "height": "Height",
+    "width": "Width",
+    "length": "Length",
+}
+SUPERLATIVE_COLUMN_LABELS = {
+    "Engin_size": "engine size", "Top_speed": "top speed", "Engine_power": "engine power",
+    "Price": "price", "Runned_Miles": "mileage", "Average_mpg": "average mpg", "Seat_num": "number of seats",
+    "Wheelbase": "wheelbase", "Height": "height", "Width": "width", "Length": "length",
+}
+DESCENDING_WORDS = {"highest", "largest", "biggest", "greatest", "most", "maximum", "max"}
+ASCENDING_WORDS = {"lowest", "smallest", "least", "minimum", "min"}
+TOP_LIST_SIZE = 5
+MAX_MAKER_WORDS = 2
+
+_SUBJECT = r"(?:car|cars|model|models|vehicle|vehicles)"
+_TOP_SELLING_RE = re.compile(
+    rf"^(?:what|which) (?:was|were|is|are) the (?:top|best)[ -]selling {_SUBJECT} (?:in|for|of|during) (\d{{4}})$"
+)
+_ENTRY_PRICE_RE = re.compile(
+    r"^(?:what|whats|what's) (?:was|is|were)? ?the entry price (?:for|of) (?:an? |the )?(.+?) in (\d{4})$"
+)
+_SUPERLATIVE_RE = re.compile(
+    rf"^(?:what|which) {_SUBJECT} (?:had|has|have) the "
+    rf"({'|'.join(sorted(DESCENDING_WORDS | ASCENDING_WORDS))}) ([a-z ]+?)$"
+)
+
+
+def normalize_question(question: str) -> str:
+    """Lower-cases, drops trailing punctuation/quotes and collapses whitespace."""
+    text = question.strip().lower().replace("’", "'")
+    text = re.sub(r"[?!.]+$", "", text).replace('"', "")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def format_number(value) -> str:
+    if isinstance(value, int):
+        return f"{value:,}"
+    if isinstance(value, float):
+        return f"{value:,.2f}".rstrip("0").rstrip(".")
+    return str(value)
+
+
+class IntentRouter:
+    """Answers fixed-shape questions with parameterized SQL, without calling the LLM.
+
+    ``route`` returns a response payload for a confident template match, or None when the
+    question should go to the agent. Entities are resolved exactly (after normalization)
+    against the value catalog; anything ambiguous, unknown or with no matching rows falls
+    through to the agent.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._sales_years = None
+        self._sales_years_key = None
+        self._lock = threading.Lock()
+        self._stats = {"questions": 0, "hits": 0, "misses": 0, "no_rows": 0, "errors": 0,
+                       "fast_path_ms_total": 0.0, "agent_runs": 0, "agent_ms_total": 0.0}
+        self._hits_by_intent = {}
+
+    def _known_sales_years(self) -> set:
+        fingerprint = self.db.pool.fingerprint()
+        with self._lock:
+            if self._sales_years_key != fingerprint:
+                self._sales_years = {str(row[0]) for row in self.db.fetch_all("SELECT DISTINCT Year FROM sales_by_year")}
+                self._sales_years_key = fingerprint
+            return self._sales_years
+
+    def _resolve_vehicle(self, catalog, text: str):
+        """Splits "ford focus" / "focus" into ``(maker or None, model)`` using exact catalog matches."""
+        words = text.split()
+        for n in range(min(MAX_MAKER_WORDS, len(words) - 1), -1, -1):
+            maker = catalog.resolve("maker", " ".join(words[:n]), fuzzy=False) if n else []
+            model = catalog.resolve("model", " ".join(words[n:]), fuzzy=False)
+            if model and (maker or n == 0):
+                return (maker[0][0] if maker else None), model[0][0]
+        return None
+
+    def _top_selling(self, question: str):
+        match = _TOP_SELLING_RE.match(question)
+        if not match or match.group(1) not in self._known_sales_years():
+            return None
+        year = int(match.group(1))
+        plural = re.search(r"(?:cars|models|vehicles) ", question) is not None
+        limit = TOP_LIST_SIZE if plural else 1
+        sql = "SELECT Maker, Genmodel, Units FROM sales_by_year WHERE Year = ? ORDER BY Units DESC LIMIT ?"
+        rows = self.db.fetch_all(sql, (year, limit))
+        if not rows:
+            return "no_rows", sql, (year, limit), None
+        if not plural:
+            maker, model, units = rows[0]
+            answer = f"The top selling car in {year} was the {maker} {model}, with {format_number(units)} units sold."
+            return "top_selling", sql, (year, limit), answer
+        lines = [f"{i}. {maker} {model}: {format_number(units)} units" for i, (maker, model, units) in enumerate(rows, 1)]
+        return "top_selling", sql, (year, limit), f"The top selling cars in {year} were:\n" + "\n".join(lines)
+
+    def _entry_price(self, question: str, catalog):
+        match = _ENTRY_PRICE_RE.match(question)
+        if not match or catalog is None:
+            return None
+        vehicle = self._resolve_vehicle(catalog, match.group(1).strip())
+        if vehicle is None:
+            return None
+        maker, model = vehicle
+        year = int(match.group(2))
+        sql = ("SELECT DISTINCT b.Automaker, p.Genmodel, p.Entry_price FROM price_table p "
+               "JOIN basic_table b ON p.Genmodel_ID = b.Genmodel_ID "
+               "WHERE UPPER(p.Genmodel) = UPPER(?) AND p.Year = ?")
+        params = (model, year)
+        if maker:
+            sql += " AND UPPER(b.Automaker) = UPPER(?)"
+            params += (maker,)
+        sql += " ORDER BY p.Entry_price"
+        rows = self.db.fetch_all(sql, params)
+        if not rows:
+            return "no_rows", sql, params, None
+        if len({(r[0], r[1]) for r in rows}) > 1 and not maker:
+            # The model name belongs to several makers; let the agent ask or disambiguate.
+            return None
+        automaker, genmodel = rows[0][0], rows[0][1]
+        prices = [format_number(r[2]) for r in rows if r[2] is not None]
+        if not prices:
+            return "no_rows", sql, params, None
+        if len(prices) == 1:
+            answer = f"The entry price for the {automaker} {genmodel} in {year} was {prices[0]}."
+        else:
+            answer = f"The {automaker} {genmodel} had several entry prices listed for {year}: {', '.join(prices)}."
+        return "entry_price", sql, params, answer
+
+    def _superlative(self, question: str):
+        match = _SUPERLATIVE_RE.match(question)
+        if not match:
+            return None
+        direction, phrase = match.group(1), match.group(2).strip()
+        column = SUPERLATIVE_COLUMNS.get(phrase)
+        if column is None:
+            return None
+        order = "DESC" if direction in DESCENDING_WORDS else "ASC"
+        # ``column`` and ``order`` come from the fixed maps above, never from the question.
+        sql = (f"SELECT Maker, Genmodel, {column} FROM vehicle_ads WHERE {column} IS NOT NULL "
+               f"ORDER BY {column} {order} LIMIT 1")
+        rows = self.db.fetch_all(sql)
+        if not rows:
+            return "no_rows", sql, (), None
+        maker, model, value = rows[0]
+        label = SUPERLATIVE_COLUMN_LABELS[column]
+        return ("superlative", sql, (),
+                f"The {maker} {model} has the {direction} {label} in the listings, at {format_number(value)}.")
+
+    def route(self, question: str):
+        """Returns ``{"agent_steps", "final_response", "intent"}`` for a template match, else None."""
+        start = time.perf_counter()
+        normalized = normalize_question(question)
+        outcome = None
+        try:
+            catalog = get_catalog(self.db)
+            for matcher in (self._top_selling, lambda q: self._entry_price(q, catalog), self._superlative):
+                outcome = matcher(normalized)
+                if outcome is not None:
+                    break
+        except Exception as e:
+            logging.warning(f"Fast path failed for '{question}', falling back to the agent: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+            outcome = None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self._stats["questions"] += 1
+            if outcome is None or outcome[3] is None:
+                self._stats["misses"] += 1
+                if outcome is not None:
+                    self._stats["no_rows"] += 1
+                return None
+            intent, sql, params, answer = outcome
+            self._stats["hits"] += 1
+            self._stats["fast_path_ms_total"] += elapsed_ms
+            self._hits_by_intent[intent] = self._hits_by_intent.get(intent, 0) + 1
+
+        logging.info(f"Fast path '{intent}' answered in {elapsed_ms:.1f} ms: {question}")
+        return {
+            "intent": intent,
+            "agent_steps": f"Fast path: {intent} (no LLM call)\nSQL: {sql}\nParams: {list(params)}",
+            "final_response": answer,
+        }
+
+    def record_agent_run(self, elapsed_ms: float):
+        """Records the latency of a question the fast path handed to the agent."""
+        with self._lock:
+            self._stats["agent_runs"] += 1
+            self._stats["agent_ms_total"] += elapsed_ms
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            by_intent = dict(self._hits_by_intent)
+        fast_avg = s["fast_path_ms_total"] / s["hits"] if s["hits"] else None
+        agent_avg = s["agent_ms_total"] / s["agent_runs"] if s["agent_runs"] else None
+        return {
+            "questions": s["questions"],
+            "hits": s["hits"],
+            "misses": s["misses"],
+            "no_rows_fallbacks": s["no_rows"],
+            "errors": s["errors"],
+            "hit_rate": round(s["hits"] / s["questions"], 3) if s["questions"] else 0.0,
+            "hits_by_intent": by_intent,
+            "avg_fast_path_ms": round(fast_avg, 2) if fast_avg is not None else None,
+            "avg_agent_ms": round(agent_avg, 1) if agent_avg is not None else None,
+            "avg_ms_saved_per_hit": round(agent_avg - fast_avg, 1) if fast_avg is not None and agent_avg is not None else None,
+        }
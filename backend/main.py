@@ -1,16 +1,69 @@
 import os
+import sys
+import json
+import argparse
 import logging
+import threading
 from database import Database 
 from agent_tools import set_database_instance
 from agents import create_sql_agent
-from langchain.schema import AIMessage, HumanMessage
+from session_memory import Session, new_session_id
+from intent_router import IntentRouter
+from value_catalog import get_catalog
+from batch import BATCH_WORKERS, read_jsonl, run_batch
 
 
 logging.basicConfig(level=logging.INFO)
 
+def run_batch_mode(db, agent_executor, path, workers, output_path=None):
+    """Answers every question in a JSONL file and writes one JSON result per line as each finishes."""
+    router = IntentRouter(db)
+    sessions = {}
+    sessions_lock = threading.Lock()
+
+    def answer(question, conversation):
+        if conversation is None:
+            session = Session(new_session_id())
+        else:
+            with sessions_lock:
+                session = sessions.setdefault(conversation, Session(new_session_id()))
+        routed = router.route(question)
+        if routed is not None:
+            payload = routed
+        else:
+            result = agent_executor.invoke({"input": question, "chat_history": session.history()})
+            payload = {"final_response": result.get("output", "No output returned."),
+                       "agent_steps": "\n".join(f"Tool Used: {a.tool} | Tool Input: {a.tool_input}"
+                                                for a, _ in result.get("intermediate_steps", []))}
+        session.record(question, payload["final_response"], get_catalog(db))
+        return payload
+
+    out = open(output_path, "w", encoding="utf-8") if output_path else sys.stdout
+    try:
+        for result in run_batch(read_jsonl(path), answer, workers):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            if "summary" in result:
+                s = result["summary"]
+                print(f"Answered {s['questions']} questions ({s['deduplicated']} deduplicated, {s['errors']} errors) "
+                      f"in {s['wall_seconds']} s: {s['questions_per_second']} questions/s, "
+                      f"p50 {s['latency_ms_p50']} ms, p95 {s['latency_ms_p95']} ms.", file=sys.stderr)
+    finally:
+        if output_path:
+            out.close()
+
 def main():
-    print("--- Running Local Test Mode (Connecting to Cloud SQL) ---")
-    print("Ensure DB environment variables are set and Cloud SQL Auth Proxy is running (recommended).")
+    parser = argparse.ArgumentParser(description="AutoQuery local chat, or batch answering of a JSONL file.")
+    parser.add_argument("--batch", metavar="QUESTIONS_JSONL",
+                        help='one question per line: "text" or {"id", "question", "conversation"}')
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="concurrent conversations in batch mode")
+    parser.add_argument("--output", help="write batch results here instead of stdout")
+    args = parser.parse_args()
+    # In batch mode stdout carries the JSONL results, so status messages go to stderr.
+    status = sys.stdout if not args.batch else sys.stderr
+
+    print("--- Running Local Test Mode (Connecting to Cloud SQL) ---", file=status)
+    print("Ensure DB environment variables are set and Cloud SQL Auth Proxy is running (recommended).", file=status)
 
     db = None
     agent_executor = None
@@ -18,20 +71,26 @@ def main():
     try:
         db = Database() 
         set_database_instance(db)
-        print("Database connection pool initialized successfully.")
+        print("Database connection pool initialized successfully.", file=status)
     except Exception as e:
-        print(f"FATAL: Failed to initialize database connection: {e}")
-        print("Please check environment variables and Cloud SQL proxy/network.")
+        print(f"FATAL: Failed to initialize database connection: {e}", file=status)
+        print("Please check environment variables and Cloud SQL proxy/network.", file=status)
         return
 
     try:
         agent_executor = create_sql_agent()
-        print("LangChain Agent created successfully.")
+        print("LangChain Agent created successfully.", file=status)
     except Exception as e:
-        print(f"FATAL: Failed to create LangChain agent: {e}")
+        print(f"FATAL: Failed to create LangChain agent: {e}", file=status)
+        return
+
+    if args.batch:
+        run_batch_mode(db, agent_executor, args.batch, args.workers, args.output)
+        db.close_connection()
         return
 
-    chat_history = []
+    session = Session(new_session_id())
+    router = IntentRouter(db)
 
     print("\nWelcome to the AutoSQL Chat Interface (Local Cloud SQL Test Mode)!")
     print("Enter your natural language queries (type 'exit' to quit).")
@@ -44,21 +103,20 @@ def main():
 
         agent_input = {
             "input": user_input,
-            "chat_history": chat_history,
+            "chat_history": session.history(),
         }
 
         try:
-            result = agent_executor.invoke(agent_input)
-            agent_output = result.get("output", "No output returned.")
+            routed = router.route(user_input)
+            if routed is not None:
+                agent_output = routed["final_response"]
+            else:
+                result = agent_executor.invoke(agent_input)
+                agent_output = result.get("output", "No output returned.")
 
             print("Agent:", agent_output)
 
-            chat_history.append(HumanMessage(content=user_input))
-            chat_history.append(AIMessage(content=agent_output))
-
-            max_history = 20
-            if len(chat_history) > max_history:
-                chat_history = chat_history[-max_history:]
+            session.record(user_input, agent_output, get_catalog(db))
 
         except Exception as e:
             print(f"\nError during local agent invocation: {e}")
@@ -1,4 +1,196 @@
+import re
+import sys
+import time
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from sql_validator import COLUMN_ALIASES
+from value_catalog import get_catalog, normalize_name
+from schema_catalog import get_schema_catalog
+
+# Hand-written descriptions; the column lists come from the live database.
+TABLE_DESCRIPTIONS = {
+    "basic_table": "Basic mapping of manufacturers to models. Use this table to filter by `Automaker`.",
+    "price_table": "Contains the manufacturer's suggested retail price (entry price) by model and year.",
+    "sales_table": 'Contains annual sales figures for each model. Column names are years (e.g., "2020").',
+    "sales_by_year": "Long-format copy of `sales_table`, one row per model and year. Use this for any sales "
+                     "question spanning several years or comparing years.",
+    "model_listing_stats": "Precomputed per-model aggregates over all `vehicle_ads` listings.",
+    "maker_listing_stats": "Precomputed per-manufacturer aggregates over all `vehicle_ads` listings "
+                           "(manufacturer taken from `basic_table.Automaker`).",
+    "year_listing_stats": "Precomputed per-registration-year aggregates over all `vehicle_ads` listings.",
+    "trim_table": "Contains details for specific trim levels of a model.",
+    "vehicle_ads": "Contains detailed, cleaned information about individual vehicle sale listings.",
+}
+
+# Words in a question that point at a table even when no column name is mentioned.
+TABLE_KEYWORDS = {
+    "sales_table": {"sale", "sales", "sell", "sold", "selling", "seller", "sellers", "bestselling", "popular", "units"},
+    "sales_by_year": {"sale", "sales", "sell", "sold", "selling", "seller", "sellers", "bestselling", "popular",
+                      "units", "trend", "years"},
+    "price_table": {"entry", "msrp", "rrp", "retail", "launch", "new"},
+    "trim_table": {"trim", "trims", "emission", "emissions", "co2", "gas"},
+    "vehicle_ads": {"listing", "listings", "ad", "ads", "advert", "adverts", "advertised", "used", "registered",
+                    "cheapest", "cheap", "expensive", "fastest", "biggest", "largest", "smallest", "highest",
+                    "lowest"},
+    "model_listing_stats": {"average", "avg", "mean", "listings", "count", "number"},
+    "maker_listing_stats": {"average", "avg", "mean", "listings", "count", "number", "manufacturers", "brands"},
+    "year_listing_stats": {"average", "avg", "mean", "listings", "count", "number"},
+}
+
+# Question words that point at specific columns.
+COLUMN_KEYWORDS = {
+    "Price": {"price", "prices", "cost", "cheap", "cheapest", "expensive", "priced", "budget", "afford"},
+    "Entry_price": {"entry", "msrp", "rrp", "retail"},
+    "Runned_Miles": {"mileage", "miles", "mile", "odometer"},
+    "Engin_size": {"engine", "litre", "liter", "displacement"},
+    "Engine_size": {"engine", "litre", "liter", "displacement"},
+    "Engine_power": {"power", "horsepower", "hp", "bhp", "powerful"},
+    "Top_speed": {"speed", "fastest", "quickest"},
+    "Average_mpg": {"mpg", "economy", "efficient", "consumption"},
+    "Gearbox": {"gearbox", "automatic", "manual", "transmission"},
+    "Fuel_type": {"fuel", "petrol", "diesel", "electric", "hybrid"},
+    "Bodytype": {"body", "suv", "hatchback", "saloon", "sedan", "estate", "wagon", "convertible", "coupe"},
+    "Color": {"color", "colour", "colours", "colors"},
+    "Reg_year": {"registered", "registration", "year", "old", "new", "newer", "older"},
+    "Adv_year": {"advertised", "listed"},
+    "Adv_month": {"month"},
+    "Seat_num": {"seats", "seater", "seat"},
+    "Door_num": {"doors", "door"},
+    "Gas_emission": {"emission", "emissions", "co2"},
+    "Trim": {"trim", "trims"},
+    "Wheelbase": {"wheelbase"},
+    "Height": {"height", "tall"},
+    "Width": {"width", "wide"},
+    "Length": {"length", "long"},
+}
+
+# Always shown for every selected table: join keys and names.
+KEY_COLUMNS = {"Genmodel_ID", "Genmodel", "Maker", "Automaker", "Year", "Reg_year", "Units"}
+# Entity kinds from the value catalog and the (table, column) a match implies.
+ENTITY_COLUMNS = {
+    "maker": ("basic_table", "Automaker"),
+    "model": ("basic_table", "Genmodel"),
+    "color": ("vehicle_ads", "Color"),
+    "bodytype": ("vehicle_ads", "Bodytype"),
+}
+# Query guidance that only matters when the table is part of the prompt's schema.
+TABLE_RULES = [
+    (("vehicle_ads",), "Body Types: If a user asks for 'Station wagon', you should query for 'Estate' (e.g., `WHERE UPPER(Bodytype) = UPPER('Estate')`)."),
+    (("vehicle_ads",), 'Numeric Columns are Clean: All columns in the `vehicle_ads` table with numeric types (INTEGER, REAL) are cleaned. You do NOT need to use `CAST` or `REPLACE` for sorting, comparison, or aggregation. You can use them directly (e.g., `WHERE Price > 20000`).'),
+    (("sales_table",), 'Sales Years (`sales_table`): The columns for years ("2001" to "2020") are INTEGERs. You MUST use double quotes for these column names in your queries (e.g., `SELECT "2015", "2016" FROM sales_table`).'),
+    (("sales_by_year", "sales_table"), 'Sales Across Years: For questions covering more than one year (e.g. "top sellers for 2018 and 2019", trends), query `sales_by_year` instead of `sales_table` (e.g. `SELECT Year, Genmodel, Units FROM sales_by_year WHERE Year IN (2018, 2019) ORDER BY Year, Units DESC`).'),
+    (("model_listing_stats", "maker_listing_stats", "year_listing_stats"),
+     'Precomputed Aggregates: For listing counts or overall price/mileage statistics per model, manufacturer or registration year WITHOUT other filters, read `model_listing_stats`, `maker_listing_stats` or `year_listing_stats` instead of aggregating `vehicle_ads`. Filtered aggregates (by color, body type, etc.) still need `vehicle_ads`.'),
+]
+ALWAYS_INCLUDED_TABLES = ["basic_table"]
+MAX_ENTITY_NGRAM = 3
+
+
+def _question_words(text: str) -> list[str]:
+    return re.findall(r"[a-z0-9]+(?:-[a-z0-9]+)?", text.lower())
+
+
+def _catalog_entities(words: list[str], catalog) -> set:
+    """Entity kinds whose catalog values appear in the question (as 1-3 word n-grams)."""
+    found = set()
+    if catalog is None:
+        return found
+    for n in range(1, MAX_ENTITY_NGRAM + 1):
+        for i in range(len(words) - n + 1):
+            key = normalize_name("".join(words[i:i + n]))
+            if len(key) < 2 or key.isdigit():
+                continue
+            for kind in ENTITY_COLUMNS:
+                if key in catalog.entities.get(kind, {}):
+                    found.add(kind)
+    return found
+
+
+def select_schema(question: str, schema: dict, catalog=None) -> dict:
+    """Picks the tables and columns a question is likely to need.
+
+    Returns ``{table: set(relevant column names)}``, matching question words against
+    table keywords, column names and their synonyms, and names from the value catalog.
+    Falls back to every table when nothing matches.
+    """
+    words = _question_words(question)
+    word_set = set(words)
+    selected = {}
+
+    def add(table, columns=()):
+        if table in schema:
+            selected.setdefault(table, set()).update(columns)
+
+    for table, keywords in TABLE_KEYWORDS.items():
+        if word_set & keywords:
+            add(table)
+
+    for table, columns in schema.items():
+        for column, _ in columns:
+            if column in KEY_COLUMNS or column.isdigit():
+                continue
+            column_words = set(column.lower().split("_"))
+            synonyms = COLUMN_KEYWORDS.get(column, set())
+            aliases = {alias for alias, targets in COLUMN_ALIASES.items() if column in targets}
+            if column.lower() in word_set or column_words <= word_set or word_set & synonyms \
+                    or word_set & {a.replace("_", "") for a in aliases}:
+                add(table, [column])
+
+    for kind in _catalog_entities(words, catalog):
+        table, column = ENTITY_COLUMNS[kind]
+        add(table, [column])
+
+    if not selected:
+        return {table: {c for c, _ in columns} for table, columns in schema.items()}
+
+    for table in ALWAYS_INCLUDED_TABLES:
+        add(table)
+    return selected
+
+
+def render_schema(schema: dict, selected: dict | None = None) -> str:
+    """Formats the schema section of the system prompt for the selected tables/columns."""
+    lines = []
+    for table, columns in schema.items():
+        if selected is not None and table not in selected:
+            continue
+        lines.append(f"        `{table}`: {TABLE_DESCRIPTIONS.get(table, '')}".rstrip())
+        wanted = None if selected is None else selected[table] | KEY_COLUMNS
+        other = []
+        year_columns = [column for column, _ in columns if column.isdigit()]
+        for column, col_type in columns:
+            if column.isdigit():
+                continue
+            if wanted is None or column in wanted:
+                lines.append(f"            `{column}` ({col_type})")
+            else:
+                other.append(f"`{column}`")
+        if year_columns:
+            years = sorted(year_columns)
+            lines.append(f'            `"{years[0]}"` ... `"{years[-1]}"` (INTEGER): one column per year')
+        if other:
+            lines.append(f"            Other columns: {', '.join(other)}")
+        lines.append("")
+    if selected is not None:
+        omitted = [t for t in schema if t not in selected]
+        if omitted:
+            lines.append(f"        Other tables (not shown): {', '.join(f'`{t}`' for t in omitted)}")
+            lines.append("")
+
+    shown = set(schema) if selected is None else set(selected)
+    rules = [text for tables, text in TABLE_RULES if shown & set(tables)]
+    if rules:
+        lines.append("        Table-specific guidance:")
+        lines += [f"          {text}" for text in rules]
+    return "\n".join(lines).rstrip()
+
+
+def schema_for_question(db, tables, question: str, history_text: str = "") -> str:
+    """Builds the question-scoped schema section from the live DB catalog."""
+    if db is None:
+        return "        (Schema unavailable: database not initialized. Use `get_table_schema`.)"
+    schema = get_schema_catalog(db, tables)
+    selected = select_schema(f"{question} {history_text}", schema, get_catalog(db))
+    return render_schema(schema, selected)
 
 def get_sql_generation_prompt():
     system_message = """
@@ -9,7 +201,7 @@ def get_sql_generation_prompt():
         Available Tools:
         1.  `execute_sql`: Executes a standard SQLite SELECT or PRAGMA query. Use this for your main data retrieval. Returns data as CSV or an error message.
         2.  `get_table_schema`: Input: `table_name`. Returns the schema (columns, types) for that table. Use this ONLY if you need to double-check column names/types for a specific table BEFORE generating your main SQL query.
-        3.  `get_distinct_values`: Input: `table_name`, `column_name`. Returns sample distinct values from a column. Use this ONLY if you need to see example data BEFORE generating your main SQL query.
+        3.  `get_distinct_values`: Input: `table_name`, `column_name`, optional `search`. Returns the most frequent values of a text column and its number of distinct values. With `search` (e.g. "F150"), returns the stored values matching that name, so you can use the exact spelling (e.g. "F-150") in your SQL. Use this BEFORE generating your main SQL query whenever you are unsure how a maker, model, color or body type is spelled.
 
         CRITICAL RULE: You MUST generate only ONE single valid SQL statement per request to the `execute_sql` tool. Only `SELECT` or `PRAGMA` statements are allowed.
 
@@ -33,7 +225,10 @@ def get_sql_generation_prompt():
              Include Calculated Values: Include aggregate values (`SUM`, `AVG`, `COUNT`) clearly in the response.
              General Formatting: Use Markdown lists for multiple items.
              Empty Results: If zero rows returned, state that no matching data was found for the specified criteria.
-           Error ('SQL Execution Error:...'): Analyze the error. If correctable (typo, ambiguous column), generate corrected SQL and call `execute_sql` AGAIN (ONE retry). If successful, answer. If it fails again or is uncorrectable, report the original error.
+             Truncated Results: Large results are capped. If the output ends with 'Result truncated: ...', the total row count that follows is exact and the column summary covers the full result (or, on very large results, the first rows it names); use them in your answer instead of re-querying for everything, and run an aggregate query if you need exact figures over a very large result.
+           Rejected ('Query Rejected: {{...}}'): The query was too expensive and was stopped (`reason` is `full_scan_join`, `timeout` or `instruction_budget`). Follow the `hint`: rewrite it ONCE as a cheaper query (join on `Genmodel_ID`, add filters, or use the precomputed tables). If it is rejected again, tell the user the question is too broad and suggest narrowing it.
+           Auto-corrected ('Note: query auto-corrected ...'): Unambiguous identifier mistakes (column case, `Engine_size` vs `Engin_size`, unquoted sales years) were fixed locally and the data that follows is the result of the corrected query. Use it directly; do NOT re-run the query.
+           Error ('SQL Execution Error:...' or 'SQL Validation Error:...'): Validation errors list the closest existing columns/tables ("Did you mean ..."); these are only spelling matches, so use one only if it means what the user asked for (e.g. `Height` is not `Weight`), otherwise say the data is not available. Analyze the error. If correctable (typo, ambiguous column), generate corrected SQL and call `execute_sql` AGAIN (ONE retry). If successful, answer. If it fails again or is uncorrectable, report the original error.
         7. FINAL RESPONSE (CRITICAL): Your final output MUST ALWAYS be user-friendly natural language text answering the question based on query results OR clearly stating why the information is unavailable based on the defined schema. ABSOLUTELY NEVER output only the SQL query itself (e.g., ```sql ... ```) as your final answer.
 
         CRITICAL FINAL OUTPUT FORMATTING RULES:
@@ -42,79 +237,9 @@ def get_sql_generation_prompt():
         3. When providing a list of items, place each item on its own new line.
 
         ACCURATE Database Schema Overview (SQLite - autoquery_data.db):
+        The tables and columns below were selected as relevant to this question. Columns listed under "Other columns" also exist; use `get_table_schema` for any table not shown.
 
-        `basic_table`: Basic mapping of manufacturers to models. Use this table to filter by `Automaker`.
-            `Automaker` (TEXT)
-            `Automaker_ID` (INTEGER)
-            `Genmodel` (TEXT)
-            `Genmodel_ID` (TEXT)
-
-        `price_table`: Contains the manufacturer's suggested retail price (entry price) by model and year.
-            `Maker` (TEXT)
-            `Genmodel` (TEXT)
-            `Genmodel_ID` (TEXT)
-            `Year` (INTEGER)
-            `Entry_price` (INTEGER)
-
-        `sales_table`: Contains annual sales figures for each model. Column names are years (e.g., "2020").
-            `Maker` (TEXT)
-            `Genmodel` (TEXT)
-            `Genmodel_ID` (TEXT)
-            `2020` (INTEGER)
-            `2019` (INTEGER)
-            `2018` (INTEGER)
-            `2017` (INTEGER)
-            `2016` (INTEGER)
-            `2015` (INTEGER)
-            `2014` (INTEGER)
-            `2013` (INTEGER)
-            `2012` (INTEGER)
-            `2011` (INTEGER)
-            `2010` (INTEGER)
-            `2009` (INTEGER)
-            `2008` (INTEGER)
-            `2007` (INTEGER)
-            `2006` (INTEGER)
-            `2005` (INTEGER)
-            `2004` (INTEGER)
-            `2003` (INTEGER)
-            `2002` (INTEGER)
-            `2001` (INTEGER)
-
-        `trim_table`: Contains details for specific trim levels of a model.
-            `Genmodel_ID` (TEXT)
-            `Maker` (TEXT)
-            `Genmodel` (TEXT)
-            `Trim` (TEXT)
-            `Year` (INTEGER)
-            `Price` (INTEGER)
-            `Gas_emission` (INTEGER)
-            `Fuel_type` (TEXT)
-            `Engine_size` (INTEGER)
-
-        `vehicle_ads`: Contains detailed, cleaned information about individual vehicle sale listings.
-            `Maker` (TEXT)
-            `Genmodel` (TEXT)
-            `Genmodel_ID` (TEXT)
-            `Adv_year` (INTEGER)
-            `Adv_month` (INTEGER)
-            `Color` (TEXT)
-            `Reg_year` (INTEGER)
-            `Bodytype` (TEXT)
-            `Runned_Miles` (INTEGER)
-            `Engin_size` (REAL)
-            `Gearbox` (TEXT)
-            `Fuel_type` (TEXT)
-            `Price` (INTEGER)
-            `Engine_power` (REAL)
-            `Wheelbase` (REAL)
-            `Height` (REAL)
-            `Width` (REAL)
-            `Length` (REAL)
-            `Average_mpg` (REAL)
-            `Top_speed` (REAL)
-            `Seat_num` (INTEGER)
-            `Door_num` (INTEGER)
+{schema}
 
         Query Best Practices & Specific Guidance (SQLite):
           Use Existing Columns Only: Do not attempt to query columns not listed in the schema above.
@@ -122,9 +247,6 @@ def get_sql_generation_prompt():
           Maker/Automaker Filtering (CRITICAL): ALWAYS use `Automaker` from `basic_table` for manufacturer filters. You MUST JOIN `basic_table` with another table using `Genmodel_ID`.
           Case-Insensitive Filtering (CRITICAL): ALWAYS use `UPPER()` on both the column and the value for ALL string comparisons in WHERE clauses (e.g., `WHERE UPPER(Color) = UPPER('Blue')`).
           Ambiguous Columns: Always qualify columns with the table name or alias in `SELECT` and `WHERE` clauses when performing a JOIN (e.g., `vehicle_ads.Price`, `trim_table.Price`).
-          Body Types: If a user asks for 'Station wagon', you should query for 'Estate' (e.g., `WHERE UPPER(Bodytype) = UPPER('Estate')`).
-          Numeric Columns are Clean: All columns in the `vehicle_ads` table with numeric types (INTEGER, REAL) are cleaned. You do NOT need to use `CAST` or `REPLACE` for sorting, comparison, or aggregation. You can use them directly (e.g., `WHERE Price > 20000`).
-          Sales Years (`sales_table`): The columns for years ("2001" to "2020") are INTEGERs. You MUST use double quotes for these column names in your queries (e.g., `SELECT "2015", "2016" FROM sales_table`).
           Finding Most Common: Use `SELECT column_name, COUNT(*) as count FROM table_name WHERE column_name IS NOT NULL AND column_name != '' GROUP BY column_name ORDER BY count DESC LIMIT 1;`.
           Top N Results: Use `LIMIT N`, combined with `ORDER BY` and `DISTINCT` where appropriate.
     """
@@ -135,4 +257,49 @@ def get_sql_generation_prompt():
         ("user", "{input}"),
         MessagesPlaceholder(variable_name="agent_scratchpad")
     ])
-    return prompt
\ No newline at end of file
+    return prompt
+
+
+# Fixed question set for measuring the effect of question-scoped schemas (README examples).
+BENCHMARK_QUESTIONS = [
+    "What was the top selling car in 2015?",
+    "What car had the largest engine size?",
+    "Which car has the highest top speed?",
+    "Show me red Ford Fiesta cars registered after 2018",
+    "List BMW cars registered in 2020 with less than 10000 miles",
+    "Find cars with an automatic gearbox and more than 200 engine power",
+    "What was the entry price for a Ford Focus in 2019?",
+    "Show sales data for the Ford F150 in 2016",
+    "List the top selling cars for 2018 and 2019",
+    "What data do you have for the 'CyberTruck' model?",
+]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough Gemini token estimate (~4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def report_schema_savings(db, tables, questions=BENCHMARK_QUESTIONS):
+    """Prints full vs. question-scoped system prompt sizes for ``questions``."""
+    system_template = get_sql_generation_prompt().messages[0].prompt.template
+    full_prompt = system_template.format(schema=render_schema(get_schema_catalog(db, tables)))
+    full_tokens = estimate_tokens(full_prompt)
+    print(f"Full-schema system prompt: ~{full_tokens} tokens")
+    total_scoped = 0
+    for question in questions:
+        start = time.perf_counter()
+        section = schema_for_question(db, tables, question)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        tokens = estimate_tokens(system_template.format(schema=section))
+        total_scoped += tokens
+        print(f"  ~{tokens:5d} tokens ({100 * (1 - tokens / full_tokens):4.1f}% saved, {elapsed_ms:.2f} ms)  {question}")
+    average = total_scoped / len(questions)
+    print(f"Average scoped prompt: ~{average:.0f} tokens, {100 * (1 - average / full_tokens):.1f}% fewer per LLM call")
+
+
+if __name__ == "__main__":
+    from database import Database, DB_FILE_PATH
+    from agent_tools import VALID_TABLES
+
+    report_schema_savings(Database(sys.argv[1] if len(sys.argv) > 1 else DB_FILE_PATH), VALID_TABLES)
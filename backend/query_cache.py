@@ -0,0 +1,210 @@
+import os
+import re
+import sqlite3
+import hashlib
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+SQL_CACHE_MAX_BYTES = int(os.environ.get("AUTOQUERY_SQL_CACHE_MB", 32)) * 1024 * 1024
+SQL_CACHE_DIR = os.environ.get("AUTOQUERY_SQL_CACHE_DIR", "")
+DISK_CACHE_FILENAME = "autoquery_sql_cache.db"
+
+# String literals, quoted identifiers, or runs of anything else.
+_SQL_TOKEN_RE = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]|[^'"`\[]+""")
+
+
+def normalize_sql(query: str) -> str:
+    """Canonical form of a SQL statement for use as a cache key.
+
+    Whitespace runs outside of literals collapse to a single space, unquoted text is
+    upper-cased (SQLite keywords and identifiers are case-insensitive) and trailing
+    semicolons are dropped. Quoted strings and identifiers are left untouched.
+    """
+    parts = []
+    for token in _SQL_TOKEN_RE.findall(query.strip().rstrip(";").strip()):
+        if token[0] in "'\"`[":
+            parts.append(token)
+        else:
+            parts.append(re.sub(r"\s+", " ", token).upper())
+    return "".join(parts).strip()
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache of string values bounded by total size in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._data: OrderedDict[str, str] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(key: str, value: str) -> int:
+        return len(key) + len(value)
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str):
+        size = self._size(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= self._size(key, old)
+            self._data[key] = value
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                evicted_key, evicted = self._data.popitem(last=False)
+                self._bytes -= self._size(evicted_key, evicted)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class DiskCache:
+    """SQLite-backed cache file shared by every worker process on the instance.
+
+    Entries are evicted least-recently-used first once the stored values exceed
+    ``max_bytes``.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache(last_access)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = OFF")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        try:
+            conn = self._connection()
+            row = conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.Error as e:
+            logging.warning(f"SQL result disk cache read failed: {e}")
+            row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return row[0]
+
+    def set(self, key: str, value: str):
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+        try:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if total > self.max_bytes:
+                evicted = 0
+                for old_key, old_size in conn.execute("SELECT key, size FROM cache ORDER BY last_access").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM cache WHERE key = ?", (old_key,))
+                    total -= old_size
+                    evicted += 1
+                with self._lock:
+                    self.evictions += evicted
+        except sqlite3.Error as e:
+            logging.warning(f"SQL result disk cache write failed: {e}")
+
+    def stats(self) -> dict:
+        try:
+            entries, used = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        except sqlite3.Error:
+            entries, used = None, None
+        with self._lock:
+            return {
+                "path": self.path,
+                "entries": entries,
+                "bytes": used,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class QueryCache:
+    """Result cache for read-only SQL keyed on normalized query text and a DB file fingerprint.
+
+    Lookups check the in-process LRU first, then the optional on-disk backend, which
+    lets gunicorn workers on the same instance share each other's results. Because
+    the fingerprint (inode, size, mtime of the DB file) is part of the key, a rebuilt
+    database never serves stale results.
+    """
+
+    def __init__(self, max_bytes: int = SQL_CACHE_MAX_BYTES, disk_dir: str = SQL_CACHE_DIR):
+        self.memory = LRUCache(max_bytes)
+        self.disk = DiskCache(os.path.join(disk_dir, DISK_CACHE_FILENAME), max_bytes) if disk_dir else None
+
+    @staticmethod
+    def make_key(query: str, fingerprint) -> str:
+        raw = f"{fingerprint}\x00{normalize_sql(query)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def stats(self) -> dict:
+        stats = {"memory": self.memory.stats()}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
@@ -0,0 +1,196 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from sql_validator import single_row_aggregate, subquery_sources, table_references
+
+QUERY_TIMEOUT_SECONDS = float(os.environ.get("AUTOQUERY_QUERY_TIMEOUT", 5))
+QUERY_MAX_VM_INSTRUCTIONS = int(os.environ.get("AUTOQUERY_QUERY_MAX_INSTRUCTIONS", 500_000_000))
+# Largest product of full-scan row counts allowed inside one nested-loop join.
+MAX_SCAN_JOIN_ROWS = int(os.environ.get("AUTOQUERY_MAX_SCAN_JOIN_ROWS", 10_000_000))
+PROGRESS_HANDLER_INTERVAL = 10_000  # VM instructions between progress handler calls
+
+
+class QueryRejected(Exception):
+    """A query was refused before execution or aborted while running.
+
+    ``reason`` is one of ``full_scan_join``, ``timeout`` or ``instruction_budget``.
+    """
+
+    def __init__(self, reason: str, message: str, hint: str, **details):
+        super().__init__(message)
+        self.reason = reason
+        self.message = message
+        self.hint = hint
+        self.details = details
+
+    def to_dict(self) -> dict:
+        return {"error": "query_rejected", "reason": self.reason, "message": self.message,
+                "hint": self.hint, **self.details}
+
+
+class QueryGuard:
+    """Bounds the cost of agent-generated SQL.
+
+    Before execution, ``preflight`` inspects ``EXPLAIN QUERY PLAN`` and rejects nested
+    loops over full table scans whose combined size exceeds ``max_scan_join_rows``
+    (e.g. an accidental cartesian join of vehicle_ads and trim_table). During execution,
+    ``limits`` installs a progress handler that aborts the statement once it runs past
+    ``timeout`` seconds or ``max_instructions`` VM instructions.
+    """
+
+    def __init__(
+        self,
+        timeout: float = QUERY_TIMEOUT_SECONDS,
+        max_instructions: int = QUERY_MAX_VM_INSTRUCTIONS,
+        max_scan_join_rows: int = MAX_SCAN_JOIN_ROWS,
+    ):
+        self.timeout = timeout
+        self.max_instructions = max_instructions
+        self.max_scan_join_rows = max_scan_join_rows
+        self._row_counts = {}
+        self._row_counts_key = None
+        self._lock = threading.Lock()
+        self._stats = {"preflight_rejections": 0, "timeouts": 0, "instruction_budget_aborts": 0}
+
+    def _table_rows(self, conn: sqlite3.Connection, table_name: str, fingerprint):
+        """Row count of ``table_name``, or None when it is not a table in the database."""
+        with self._lock:
+            if self._row_counts_key != fingerprint:
+                self._row_counts = {}
+                self._row_counts_key = fingerprint
+                try:
+                    # With an index the first number of `stat` is the table's row count.
+                    for tbl, stat in conn.execute("SELECT tbl, stat FROM sqlite_stat1"):
+                        self._row_counts.setdefault(tbl.lower(), int(stat.split()[0]))
+                except sqlite3.Error:
+                    pass
+            rows = self._row_counts.get(table_name.lower())
+        if rows is None:
+            try:
+                rows = conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+            except sqlite3.Error:
+                return None
+            with self._lock:
+                self._row_counts[table_name.lower()] = rows
+        return rows
+
+    def preflight(self, conn: sqlite3.Connection, query: str, fingerprint=None):
+        """Raises QueryRejected if the plan nests full scans over too many rows."""
+        try:
+            plan = conn.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+        except sqlite3.Error:
+            # Let the real execution report syntax errors in its usual form.
+            return
+
+        aliases = table_references(query)
+        subqueries = subquery_sources(query)
+
+        scans_by_parent = {}
+        subquery_nodes = {}  # materialized subquery / CTE name -> its node id in the plan
+        children = {}
+        for node, parent, _, detail in plan:
+            children.setdefault(parent, []).append(detail)
+            match = re.match(r"(?:MATERIALIZE|CO-ROUTINE) (\w+)", detail)
+            if match:
+                subquery_nodes[match.group(1).lower()] = node
+            match = re.match(r"SCAN (\w+)", detail)
+            if match and match.group(1).upper() not in ("CONSTANT", "SUBQUERY"):
+                scans_by_parent.setdefault(parent, []).append(match.group(1))
+
+        def rows_of(name, seen=()):
+            """Rows a scan of ``name`` reads: a table, an alias, or a subquery result; None if unknown."""
+            key = name.lower()
+            if key in subquery_nodes and key not in seen:
+                return subquery_rows(key, seen + (key,))
+            return self._table_rows(conn, aliases.get(key, name), fingerprint)
+
+        def subquery_rows(key, seen):
+            if key in subqueries and single_row_aggregate(subqueries[key]):
+                return 1
+            details = children.get(subquery_nodes[key], [])
+            if any(d.startswith("COMPOUND") for d in details):
+                return None
+            estimate = 1
+            for name in scans_by_parent.get(subquery_nodes[key], []):
+                n = rows_of(name, seen)
+                if n is None:
+                    return None
+                estimate *= max(n, 1)
+            return estimate
+
+        for scans in scans_by_parent.values():
+            if len(scans) < 2:
+                continue
+            tables = [aliases.get(name.lower(), name) for name in scans]
+            rows = [rows_of(name) for name in scans]
+            if None in rows:
+                # A name we could not resolve at all: assume it is as large as the largest table.
+                with self._lock:
+                    largest = max(self._row_counts.values(), default=self.max_scan_join_rows)
+                rows = [largest if n is None else n for n in rows]
+            estimate = 1
+            for n in rows:
+                estimate *= max(n, 1)
+            if estimate > self.max_scan_join_rows:
+                with self._lock:
+                    self._stats["preflight_rejections"] += 1
+                raise QueryRejected(
+                    "full_scan_join",
+                    f"Query joins full scans of {', '.join(tables)} with no usable index "
+                    f"(~{estimate:,} row combinations).",
+                    "Join on an indexed key such as Genmodel_ID (e.g. `JOIN basic_table b ON "
+                    "v.Genmodel_ID = b.Genmodel_ID`) and add selective WHERE filters.",
+                    tables=tables,
+                    estimated_rows=estimate,
+                    plan=[row[3] for row in plan],
+                )
+
+    @contextmanager
+    def limits(self, conn: sqlite3.Connection):
+        """Aborts the statement(s) run inside the block once a time or instruction budget is spent."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        max_calls = max(self.max_instructions // PROGRESS_HANDLER_INTERVAL, 1)
+        state = {"calls": 0, "reason": None}
+
+        def progress():
+            state["calls"] += 1
+            if state["calls"] > max_calls:
+                state["reason"] = "instruction_budget"
+                return 1
+            if time.monotonic() > deadline:
+                state["reason"] = "timeout"
+                return 1
+            return 0
+
+        conn.set_progress_handler(progress, PROGRESS_HANDLER_INTERVAL)
+        try:
+            yield
+        except sqlite3.OperationalError as e:
+            if state["reason"] is None:
+                raise
+            elapsed_ms = round((time.monotonic() - start) * 1000, 1)
+            with self._lock:
+                self._stats["timeouts" if state["reason"] == "timeout" else "instruction_budget_aborts"] += 1
+            if state["reason"] == "timeout":
+                raise QueryRejected(
+                    "timeout", f"Query aborted after {elapsed_ms} ms (limit {self.timeout:g} s).",
+                    "Add selective filters, avoid joining large tables without Genmodel_ID, "
+                    "or use the precomputed *_listing_stats / sales_by_year tables.",
+                    elapsed_ms=elapsed_ms,
+                ) from e
+            raise QueryRejected(
+                "instruction_budget",
+                f"Query aborted after exceeding {self.max_instructions:,} SQLite VM instructions.",
+                "Add selective filters or aggregate with the precomputed *_listing_stats tables.",
+                elapsed_ms=elapsed_ms,
+            ) from e
+        finally:
+            conn.set_progress_handler(None, 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,31 @@
+import threading
+import logging
+
+_schema = None
+_schema_key = None
+_schema_lock = threading.Lock()
+
+
+def load_schema(db, tables) -> dict:
+    """Reads ``{table: [(column, type), ...]}`` for ``tables`` from the live database."""
+    schema = {}
+    for table_name in tables:
+        try:
+            rows = db.fetch_all(f'PRAGMA table_info("{table_name}")')
+        except Exception as e:
+            logging.warning(f"Could not read schema of '{table_name}': {e}")
+            continue
+        if rows:
+            schema[table_name] = [(row[1], row[2] or "") for row in rows]
+    return schema
+
+
+def get_schema_catalog(db, tables) -> dict:
+    """Process-wide schema catalog for ``tables``, reloaded when the DB file changes."""
+    global _schema, _schema_key
+    key = (db.pool.fingerprint(), tuple(tables))
+    with _schema_lock:
+        if _schema_key != key:
+            _schema = load_schema(db, tables)
+            _schema_key = key
+        return _schema
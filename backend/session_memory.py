@@ -0,0 +1,196 @@
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from langchain.schema import AIMessage, HumanMessage
+from prompts import estimate_tokens
+from value_catalog import normalize_name
+
+SESSION_TOKEN_BUDGET = int(os.environ.get("AUTOQUERY_SESSION_TOKEN_BUDGET", 1500))
+SESSION_IDLE_TTL = float(os.environ.get("AUTOQUERY_SESSION_IDLE_TTL", 1800))
+SESSION_MAX_SESSIONS = int(os.environ.get("AUTOQUERY_SESSION_MAX_SESSIONS", 1000))
+MIN_RECENT_TURNS = 1
+SUMMARY_MAX_LINES = 6
+SUMMARY_ANSWER_CHARS = 160
+MAX_ENTITIES_PER_KIND = 8
+ENTITY_KINDS = ("maker", "model")
+
+_YEAR_RE = re.compile(r"\b(?:19|20)\d{2}\b")
+# In answers a bare 4-digit number is as likely a price, unit count or mileage as a year.
+_YEAR_CONTEXT_RE = re.compile(
+    r"\b(?:in|during|since|until|year|registered|registration)\s+((?:19|20)\d{2})\b(?![.,]\d)",
+    re.IGNORECASE,
+)
+_WORD_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9\-]*")
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def extract_entities(question: str, catalog, answer: str = "") -> dict:
+    """Years and catalog makers/models mentioned in a turn, as ``{kind: [value, ...]}``.
+
+    Any year-like number in the question counts; in the answer only years in a year phrase
+    ("in 2019", "registered 2018") do.
+    """
+    found = {"year": list(dict.fromkeys(_YEAR_RE.findall(question) + _YEAR_CONTEXT_RE.findall(answer)))}
+    if catalog is None:
+        return found
+    words = _WORD_RE.findall(f"{question} {answer}")
+    # Single words and adjacent pairs, so "Land Rover" and "Range Rover" resolve too.
+    candidates = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for kind in ENTITY_KINDS:
+        index = catalog.entities.get(kind, {})
+        matches = []
+        for candidate in candidates:
+            key = normalize_name(candidate)
+            if len(key) > 1 and key in index and not key.isdigit():
+                matches.append(index[key][0][0])
+        found[kind] = list(dict.fromkeys(matches))
+    return found
+
+
+class Session:
+    """Conversation memory of one client, kept under ``token_budget`` estimated tokens.
+
+    Recent turns are kept verbatim. When they overflow the budget the oldest are
+    compacted into one-line summaries, and the makers, models and years they mention are
+    kept as resolved entities so follow-ups ("what about 2019?") still have context.
+    """
+
+    def __init__(self, session_id: str, token_budget: int = SESSION_TOKEN_BUDGET):
+        self.session_id = session_id
+        self.token_budget = token_budget
+        self.turns: list[tuple[str, str]] = []
+        self.summary: list[str] = []
+        self.entities: dict[str, OrderedDict] = {}
+        self.compactions = 0
+        self.last_used = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _context_text(self) -> str:
+        parts = []
+        if self.summary:
+            parts.append("Earlier questions: " + " | ".join(self.summary))
+        entities = [f"{kind}: {', '.join(values)}" for kind, values in self.entities.items() if values]
+        if entities:
+            parts.append("Entities already resolved: " + "; ".join(entities))
+        return "\n".join(parts)
+
+    def _tokens(self) -> int:
+        return estimate_tokens(self._context_text()) + sum(estimate_tokens(q) + estimate_tokens(a) for q, a in self.turns)
+
+    def _remember_entities(self, found: dict):
+        for kind, values in found.items():
+            known = self.entities.setdefault(kind, OrderedDict())
+            for value in values:
+                known.pop(value, None)
+                known[value] = None
+            while len(known) > MAX_ENTITIES_PER_KIND:
+                known.popitem(last=False)
+
+    def _compact(self, catalog):
+        while len(self.turns) > MIN_RECENT_TURNS and self._tokens() > self.token_budget:
+            question, answer = self.turns.pop(0)
+            short_answer = " ".join(answer.split())
+            if len(short_answer) > SUMMARY_ANSWER_CHARS:
+                short_answer = short_answer[:SUMMARY_ANSWER_CHARS] + "..."
+            self.summary.append(f"Q: {question} A: {short_answer}")
+            self.summary = self.summary[-SUMMARY_MAX_LINES:]
+            self._remember_entities(extract_entities(question, catalog, answer))
+            self.compactions += 1
+        # If the last kept turn alone nearly fills the budget, the summary goes first, then its answer is cut.
+        while self.summary and self._tokens() > self.token_budget:
+            self.summary.pop(0)
+        overflow = self._tokens() - self.token_budget
+        if overflow > 0 and self.turns:
+            question, answer = self.turns[-1]
+            self.turns[-1] = (question, answer[:max(len(answer) - overflow * 4 - 3, SUMMARY_ANSWER_CHARS)] + "...")
+
+    def history(self) -> list:
+        """Messages for the prompt's chat_history: compacted context first, then recent turns."""
+        with self._lock:
+            self.last_used = time.monotonic()
+            messages = []
+            context = self._context_text()
+            if context:
+                messages.append(HumanMessage(content=f"Context from earlier in this conversation:\n{context}"))
+                messages.append(AIMessage(content="Understood."))
+            for question, answer in self.turns:
+                messages.append(HumanMessage(content=question))
+                messages.append(AIMessage(content=answer))
+            return messages
+
+    def record(self, question: str, answer: str, catalog=None):
+        """Appends a turn, compacting older turns that no longer fit the token budget."""
+        with self._lock:
+            self.turns.append((question, answer))
+            self.last_used = time.monotonic()
+            self._compact(catalog)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"turns": len(self.turns), "summary_lines": len(self.summary),
+                    "tokens": self._tokens(), "compactions": self.compactions}
+
+
+class SessionStore:
+    """Thread-safe map of session ID -> Session that evicts idle and least recently used sessions."""
+
+    def __init__(
+        self,
+        token_budget: int = SESSION_TOKEN_BUDGET,
+        idle_ttl: float = SESSION_IDLE_TTL,
+        max_sessions: int = SESSION_MAX_SESSIONS,
+    ):
+        self.token_budget = token_budget
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "idle_evictions": 0, "lru_evictions": 0}
+
+    def _evict(self):
+        now = time.monotonic()
+        # Sessions are ordered by last access, so idle ones are at the front.
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used <= self.idle_ttl:
+                break
+            del self._sessions[session_id]
+            self._stats["idle_evictions"] += 1
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self._stats["lru_evictions"] += 1
+
+    def get(self, session_id: str) -> Session:
+        """Returns the session for ``session_id``, creating it if it is new or was evicted."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                session = Session(session_id, self.token_budget)
+                self._stats["created"] += 1
+            session.last_used = time.monotonic()
+            self._sessions[session_id] = session
+            self._evict()
+            return session
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._evict()
+            sessions = list(self._sessions.values())
+        tokens = [s.stats()["tokens"] for s in sessions]
+        stats = {
+            "sessions": len(sessions),
+            "max_sessions": self.max_sessions,
+            "idle_ttl_seconds": self.idle_ttl,
+            "token_budget": self.token_budget,
+            "max_session_tokens": max(tokens, default=0),
+            "compactions": sum(s.compactions for s in sessions),
+        }
+        with self._lock:
+            stats.update(self._stats)
+        return stats
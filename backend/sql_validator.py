@@ -0,0 +1,328 @@
+import re
+import difflib
+
+MAX_CORRECTIONS = 5
+# Fuzzy matches are only ever suggested, never applied: "Weight" is close to "Height"
+# but means something else.
+SUGGESTION_CUTOFF = 0.5
+
+# Names the model tends to use for columns that exist under a different spelling.
+COLUMN_ALIASES = {
+    "engine_size": ["Engin_size", "Engine_size"],
+    "engin_size": ["Engin_size", "Engine_size"],
+    "mileage": ["Runned_Miles"],
+    "miles": ["Runned_Miles"],
+    "running_miles": ["Runned_Miles"],
+    "make": ["Maker", "Automaker"],
+    "manufacturer": ["Maker", "Automaker"],
+    "brand": ["Maker", "Automaker"],
+    "model": ["Genmodel"],
+    "model_id": ["Genmodel_ID"],
+    "colour": ["Color"],
+    "body_type": ["Bodytype"],
+    "fuel": ["Fuel_type"],
+    "transmission": ["Gearbox"],
+    "mpg": ["Average_mpg"],
+    "seats": ["Seat_num"],
+    "doors": ["Door_num"],
+}
+
+SALES_YEAR_TABLE = "sales_table"
+AGGREGATE_FUNCTIONS = {"SUM", "AVG", "MIN", "MAX", "TOTAL", "COUNT", "GROUP_CONCAT"}
+_OUT_OF_RANGE_RE = re.compile(r"(?:ORDER|GROUP) BY term out of range", re.IGNORECASE)
+
+_TOKEN_RE = re.compile(
+    r"""(?P<string>'(?:[^']|'')*')"""
+    r"""|(?P<quoted>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])"""
+    r"""|(?P<number>\d+(?:\.\d+)?)"""
+    r"""|(?P<word>[A-Za-z_][A-Za-z0-9_]*)"""
+    r"""|(?P<op><=|>=|<>|!=|==|\|\||[^\sA-Za-z0-9_'"`\[])"""
+    r"""|(?P<space>\s+)"""
+)
+# Words that end a FROM/JOIN item, so they are never taken as a table alias.
+_CLAUSE_WORDS = {
+    "ON", "USING", "WHERE", "JOIN", "LEFT", "RIGHT", "FULL", "INNER", "OUTER", "CROSS", "NATURAL",
+    "GROUP", "ORDER", "LIMIT", "HAVING", "UNION", "EXCEPT", "INTERSECT", "WINDOW", "INDEXED", "NOT",
+}
+
+
+def tokenize(query: str) -> list[tuple[str, str]]:
+    """Splits SQL into ``(kind, text)`` tokens; kinds are string, quoted, number, word, op, space."""
+    return [(m.lastgroup, m.group()) for m in _TOKEN_RE.finditer(query)]
+
+
+def table_references(query: str) -> dict:
+    """Maps every table name and alias in FROM/JOIN clauses (lower-cased) to the table name.
+
+    Comma-separated FROM lists (``FROM vehicle_ads v, trim_table t``) are followed item by item.
+    """
+    words = [(kind, text) for kind, text in tokenize(query) if kind != "space"]
+    references = {}
+    i = 0
+    while i < len(words):
+        if words[i][1].upper() not in ("FROM", "JOIN"):
+            i += 1
+            continue
+        i += 1
+        while i < len(words):
+            if words[i][1] == "(":
+                # A subquery item: collect its own tables, then skip past it and its alias.
+                depth, j = 0, i
+                while j < len(words):
+                    depth += {"(": 1, ")": -1}.get(words[j][1], 0)
+                    j += 1
+                    if depth == 0:
+                        break
+                references.update(table_references(" ".join(text for _, text in words[i + 1:j - 1])))
+                i = j
+                if i < len(words) and words[i][1].upper() == "AS":
+                    i += 1
+                if i < len(words) and words[i][0] in ("word", "quoted") and words[i][1].upper() not in _CLAUSE_WORDS:
+                    i += 1
+                if i < len(words) and words[i][1] == ",":
+                    i += 1
+                    continue
+                break
+            if words[i][0] not in ("word", "quoted"):
+                break
+            table_name = words[i][1].strip('"`[]')
+            i += 1
+            if i + 1 < len(words) and words[i][1] == "." and words[i + 1][0] in ("word", "quoted"):
+                # schema.table
+                table_name = words[i + 1][1].strip('"`[]')
+                i += 2
+            references[table_name.lower()] = table_name
+            if i < len(words) and words[i][1].upper() == "AS":
+                i += 1
+            if i < len(words) and words[i][0] in ("word", "quoted") and words[i][1].upper() not in _CLAUSE_WORDS:
+                references[words[i][1].strip('"`[]').lower()] = table_name
+                i += 1
+            if i < len(words) and words[i][1] == ",":
+                i += 1
+                continue
+            break
+    return references
+
+
+def subquery_sources(query: str) -> dict:
+    """Maps each derived table alias and CTE name (lower-cased) to its SELECT text.
+
+    Covers ``FROM (SELECT ...) [AS] x`` and ``WITH x AS (SELECT ...)``.
+    """
+    words = [(kind, text) for kind, text in tokenize(query) if kind != "space"]
+    sources = {}
+    for i, (kind, text) in enumerate(words):
+        if text != "(" or i + 1 >= len(words) or words[i + 1][1].upper() not in ("SELECT", "WITH"):
+            continue
+        depth, j = 0, i
+        while j < len(words):
+            depth += {"(": 1, ")": -1}.get(words[j][1], 0)
+            j += 1
+            if depth == 0:
+                break
+        inner = " ".join(t for _, t in words[i + 1:j - 1])
+        if i >= 2 and words[i - 1][1].upper() == "AS" and words[i - 2][0] in ("word", "quoted"):
+            sources[words[i - 2][1].strip('"`[]').lower()] = inner  # WITH x AS (...)
+            continue
+        k = j + 1 if j < len(words) and words[j][1].upper() == "AS" else j
+        if k < len(words) and words[k][0] in ("word", "quoted") and words[k][1].upper() not in _CLAUSE_WORDS:
+            sources[words[k][1].strip('"`[]').lower()] = inner
+    return sources
+
+
+def single_row_aggregate(select_sql: str) -> bool:
+    """True for a SELECT that aggregates with no GROUP BY or window, so it returns exactly one row."""
+    depth = 0
+    words = [(kind, text) for kind, text in tokenize(select_sql) if kind != "space"]
+    aggregate = False
+    for i, (kind, text) in enumerate(words):
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif depth == 0 and kind == "word":
+            upper = text.upper()
+            if upper in ("GROUP", "OVER", "UNION", "INTERSECT", "EXCEPT"):
+                return False
+            if upper in AGGREGATE_FUNCTIONS and i + 1 < len(words) and words[i + 1][1] == "(":
+                aggregate = True
+    return aggregate
+
+
+def quote_sales_years(query: str, sales_years, by_terms: bool = False) -> tuple[str, list[str]]:
+    """Double-quotes bare year numbers used as sales_table columns (`SELECT 2015 ...` -> `"2015"`).
+
+    Only numbers that cannot be meant as literals are rewritten: a whole select-list term
+    (`SELECT Genmodel, 2015 FROM ...`) or the sole argument of an aggregate (`SUM(2015)`).
+    With ``by_terms`` ORDER/GROUP BY terms are rewritten too; SQLite reads those as column
+    positions, so this is only done after the query failed with "term out of range".
+    Numbers followed by AS, used in arithmetic, inside CASE or IN (...), in compound
+    (UNION) selects, or whose quoted form the query already uses are kept as literals.
+    """
+    if SALES_YEAR_TABLE not in {t.lower() for t in table_references(query).values()}:
+        return query, []
+
+    tokens = tokenize(query)
+    significant = [i for i, (kind, _) in enumerate(tokens) if kind != "space"]
+    words = {text.upper() for kind, text in tokens if kind == "word"}
+    quoted = {text[1:-1] for kind, text in tokens if kind == "quoted"}
+    compound = bool(words & {"UNION", "INTERSECT", "EXCEPT"})
+    clause_by_depth = {}
+    in_list_depth = []
+    depth = 0
+    case_depth = 0
+    corrections = []
+    for pos, i in enumerate(significant):
+        kind, text = tokens[i]
+        upper = text.upper()
+        prev = tokens[significant[pos - 1]][1].upper() if pos > 0 else ""
+        before_prev = tokens[significant[pos - 2]][1].upper() if pos > 1 else ""
+        nxt = tokens[significant[pos + 1]][1].upper() if pos + 1 < len(significant) else ""
+        if text == "(":
+            depth += 1
+            if prev == "IN":
+                in_list_depth.append(depth)
+        elif text == ")":
+            if in_list_depth and in_list_depth[-1] == depth:
+                in_list_depth.pop()
+            clause_by_depth.pop(depth, None)
+            depth -= 1
+        elif kind == "word" and upper == "CASE":
+            case_depth += 1
+        elif kind == "word" and upper == "END" and case_depth:
+            case_depth -= 1
+        elif kind == "word" and upper in ("SELECT", "FROM", "WHERE", "GROUP", "ORDER", "HAVING", "LIMIT", "WINDOW"):
+            clause_by_depth[depth] = upper
+        if kind != "number" or text not in sales_years or in_list_depth or case_depth:
+            continue
+        clause = clause_by_depth.get(depth)
+        literal_hint = text in quoted  # `2019 AS Year, "2019" AS Units`: the bare number is a label
+        select_term = (clause == "SELECT" and not compound and not literal_hint
+                       and prev in ("SELECT", "DISTINCT", ",") and nxt in (",", "FROM", ""))
+        aggregate_argument = (not literal_hint and prev == "(" and nxt == ")" and before_prev in AGGREGATE_FUNCTIONS
+                              and clause_by_depth.get(depth - 1) in ("SELECT", "HAVING", "ORDER"))
+        by_term = (by_terms and clause in ("GROUP", "ORDER") and prev in ("BY", ",")
+                   and nxt in (",", ")", "", "ASC", "DESC", "LIMIT", "HAVING", "NULLS", "COLLATE"))
+        if select_term or aggregate_argument or by_term:
+            tokens[i] = ("quoted", f'"{text}"')
+            corrections.append(f'{text} -> "{text}"')
+    return "".join(text for _, text in tokens), corrections
+
+
+def replace_identifier(query: str, old: str, new: str, qualifier: str | None = None) -> str:
+    """Replaces identifier ``old`` (bare or quoted, optionally as ``qualifier.old``) with ``new``."""
+    tokens = tokenize(query)
+    for i, (kind, text) in enumerate(tokens):
+        name = text[1:-1] if kind == "quoted" else text if kind == "word" else None
+        if name is None or name.lower() != old.lower():
+            continue
+        if qualifier is not None:
+            if i < 2 or tokens[i - 1][1] != "." or tokens[i - 2][1].strip('"`[]').lower() != qualifier.lower():
+                continue
+        tokens[i] = ("quoted", f'"{new}"') if kind == "quoted" or not new.isidentifier() else ("word", new)
+    return "".join(text for _, text in tokens)
+
+
+def _candidates(name: str, choices: list[str]) -> list[str]:
+    """The column or table ``name`` certainly meant: a case-only, alias or underscore-insensitive match."""
+    lowered = {c.lower(): c for c in choices}
+    if name.lower() in lowered:
+        return [lowered[name.lower()]]
+    aliased = [c for c in COLUMN_ALIASES.get(name.lower(), []) if c in choices]
+    if len(aliased) == 1:
+        return aliased
+    if aliased:
+        # e.g. `make` with both vehicle_ads.Maker and basic_table.Automaker in scope.
+        return []
+    squashed = {c.replace("_", "").lower(): c for c in choices}
+    if name.replace("_", "").lower() in squashed:
+        return [squashed[name.replace("_", "").lower()]]
+    return []
+
+
+def _suggestions(name: str, choices: list[str], limit: int = 3) -> list[str]:
+    suggested = _candidates(name, choices) or [c for c in COLUMN_ALIASES.get(name.lower(), []) if c in choices]
+    if not suggested:
+        lowered = {c.lower(): c for c in choices}
+        suggested = [lowered[c] for c in difflib.get_close_matches(name.lower(), list(lowered), n=limit,
+                                                                   cutoff=SUGGESTION_CUTOFF)]
+    return suggested[:limit]
+
+
+def _fix_error(query: str, error: str, schema: dict) -> tuple[str | None, str | None, str]:
+    """Tries to repair one compile error. Returns ``(fixed_query, correction, diagnostic)``."""
+    references = table_references(query)
+    referenced = sorted({t for t in references.values() if t in schema})
+
+    match = re.search(r"no such table: (?:\w+\.)?(\w+)", error)
+    if match:
+        name = match.group(1)
+        tables = list(schema)
+        candidates = _candidates(name, tables)
+        if len(candidates) == 1:
+            return replace_identifier(query, name, candidates[0]), f"table {name} -> {candidates[0]}", ""
+        suggestions = _suggestions(name, tables)
+        hint = f" Did you mean: {', '.join(suggestions)}?" if suggestions else ""
+        return None, None, f"Unknown table '{name}'.{hint} Available tables: {', '.join(tables)}."
+
+    match = re.search(r"no such column: (?:(\w+)\.)?([\w ]+)", error)
+    if match:
+        qualifier, name = match.group(1), match.group(2).strip()
+        if qualifier and qualifier.lower() in references:
+            scope = [references[qualifier.lower()]]
+        else:
+            scope = referenced or list(schema)
+        columns = [c for t in scope if t in schema for c, _ in schema[t]]
+        unique_columns = list(dict.fromkeys(columns))
+        candidates = _candidates(name, unique_columns)
+        if len(candidates) == 1:
+            fixed = replace_identifier(query, name, candidates[0], qualifier)
+            if fixed != query:
+                label = f"{qualifier}.{name}" if qualifier else name
+                return fixed, f"column {label} -> {candidates[0]}", ""
+        suggestions = _suggestions(name, unique_columns)
+        owners = {c: [t for t in scope if any(c == col for col, _ in schema.get(t, []))] for c in suggestions}
+        if suggestions:
+            hint = " Did you mean: " + ", ".join(f"{'/'.join(owners[c])}.{c}" for c in suggestions) + "?"
+        else:
+            hint = " Available columns: " + ", ".join(unique_columns[:30]) + "."
+        where = f" in {', '.join(scope)}" if scope else ""
+        return None, None, f"Unknown column '{name}'{where}.{hint}"
+
+    match = re.search(r"ambiguous column name: (\w+)", error)
+    if match:
+        name = match.group(1)
+        refs_by_table = {}
+        for ref, t in references.items():
+            refs_by_table.setdefault(t, []).append(ref)
+        owners = [next((r for r in refs if r != t.lower()), t) for t, refs in refs_by_table.items()
+                  if any(c.lower() == name.lower() for c, _ in schema.get(t, []))]
+        qualified = ", ".join(f"{o}.{name}" for o in owners)
+        return None, None, f"Column '{name}' exists in several joined tables; qualify it, e.g. {qualified}."
+
+    return None, None, ""
+
+
+def validate_and_correct(query: str, compile_check, schema: dict, sales_years) -> tuple[str, list[str], str | None]:
+    """Compiles ``query`` locally and repairs unambiguous identifier mistakes.
+
+    ``compile_check(query)`` returns None when the statement compiles, else the error text.
+    Returns ``(query, corrections, error)``; ``error`` is a diagnostic string when the query
+    still does not compile after all unambiguous fixes were applied.
+    """
+    query, corrections = quote_sales_years(query, sales_years)
+    for _ in range(MAX_CORRECTIONS):
+        error = compile_check(query)
+        if error is None:
+            return query, list(dict.fromkeys(corrections)), None
+        if _OUT_OF_RANGE_RE.search(error):
+            # `ORDER BY 2015` is read as the 2015th result column; the model meant the sales year.
+            fixed, by_corrections = quote_sales_years(query, sales_years, by_terms=True)
+            correction, diagnostic = ", ".join(by_corrections), ""
+        else:
+            fixed, correction, diagnostic = _fix_error(query, error, schema)
+        if fixed is None or fixed == query:
+            return query, list(dict.fromkeys(corrections)), f"{error}. {diagnostic}".strip()
+        query = fixed
+        corrections.append(correction)
+    return query, list(dict.fromkeys(corrections)), compile_check(query)
@@ -0,0 +1,116 @@
+import os
+import json
+import queue
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.callbacks import BaseCallbackHandler
+
+STREAM_WORKERS = int(os.environ.get("AUTOQUERY_STREAM_WORKERS", 8))
+OBSERVATION_SUMMARY_CHARS = 300
+KEEPALIVE_SECONDS = 10.0
+_DONE = object()
+
+# Agent runs for /api/chat/stream. Reusing threads keeps each one's pooled SQLite connection
+# alive across requests; runs beyond STREAM_WORKERS wait for a free worker.
+_stream_pool = ThreadPoolExecutor(max_workers=STREAM_WORKERS, thread_name_prefix="stream")
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Formats one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def summarize_observation(observation) -> dict:
+    text = str(observation)
+    lines = text.count("\n")
+    summary = text if len(text) <= OBSERVATION_SUMMARY_CHARS else text[:OBSERVATION_SUMMARY_CHARS] + "..."
+    return {"summary": summary, "lines": lines, "chars": len(text)}
+
+
+class StreamingCallbackHandler(BaseCallbackHandler):
+    """Pushes agent progress (tool calls, observations, LLM tokens) onto a queue as SSE strings."""
+
+    def __init__(self):
+        self.events: queue.Queue = queue.Queue()
+
+    def emit(self, event: str, data: dict):
+        self.events.put(sse_event(event, data))
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.emit("llm_start", {})
+
+    def on_llm_new_token(self, token, **kwargs):
+        if isinstance(token, str) and token:
+            self.emit("token", {"text": token})
+
+    def on_agent_action(self, action, **kwargs):
+        data = {"tool": action.tool, "input": action.tool_input}
+        if action.tool == "execute_sql" and isinstance(action.tool_input, dict):
+            data["sql"] = action.tool_input.get("query")
+        self.emit("tool_call", data)
+
+    def on_tool_end(self, output, **kwargs):
+        self.emit("observation", summarize_observation(getattr(output, "content", output)))
+
+    def on_tool_error(self, error, **kwargs):
+        self.emit("observation", {"summary": f"Tool error: {error}", "lines": 0, "chars": 0})
+
+
+def stream_agent_run(run, started_at: float, on_complete=None):
+    """Runs ``run(handler)`` on the stream worker pool and yields its progress as SSE strings.
+
+    ``run`` returns the final payload dict, which is sent as the ``final`` event. The
+    ``done`` event carries the time to the first real progress event (tool call, observation,
+    token or the final answer), the time to the first answer token, and the total time, all
+    measured from ``started_at`` at the moment each event is yielded. Whether the bytes reach
+    the client then depends on the server in front: App Engine standard buffers the whole
+    response, so the frontend reports its own timings separately. The synthetic ``start``
+    event is not timed: it is sent before any agent work and says nothing about latency.
+    """
+    handler = StreamingCallbackHandler()
+    outcome = {}
+
+    def worker():
+        try:
+            outcome["payload"] = run(handler)
+        except Exception as e:
+            logging.error("Streaming agent run failed:", exc_info=True)
+            outcome["error"] = str(e)
+        finally:
+            handler.events.put(_DONE)
+
+    _stream_pool.submit(worker)
+
+    timings = {}
+
+    def mark(name):
+        if name not in timings:
+            timings[name] = round((time.perf_counter() - started_at) * 1000, 1)
+
+    yield sse_event("start", {})
+    while True:
+        try:
+            item = handler.events.get(timeout=KEEPALIVE_SECONDS)
+        except queue.Empty:
+            yield ": keepalive\n\n"
+            continue
+        if item is _DONE:
+            break
+        if item.startswith("event: token"):
+            mark("first_token_ms")
+        if not item.startswith("event: llm_start"):
+            mark("first_progress_ms")
+        yield item
+
+    if "error" in outcome:
+        yield sse_event("error", {"error": outcome["error"]})
+    else:
+        # Cached and fast-path answers arrive with no earlier progress; the answer itself is the first.
+        mark("first_progress_ms")
+        yield sse_event("final", outcome["payload"])
+    mark("total_ms")
+    logging.info(f"Streamed agent run timings: {timings}")
+    if on_complete is not None:
+        on_complete(timings)
+    yield sse_event("done", timings)
@@ -0,0 +1,54 @@
+import sqlite3
+
+import pytest
+
+from query_guard import QueryGuard, QueryRejected
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE vehicle_ads (Maker TEXT, Genmodel TEXT, Genmodel_ID TEXT, Engine_power REAL);
+        CREATE TABLE trim_table (Genmodel_ID TEXT, Trim TEXT);
+    """)
+    conn.executemany("INSERT INTO vehicle_ads VALUES (?, ?, ?, ?)",
+                     [(f"M{i % 7}", f"G{i % 50}", f"ID{i % 50}", float(i % 300)) for i in range(2000)])
+    conn.executemany("INSERT INTO trim_table VALUES (?, ?)", [(f"ID{i}", f"T{i}") for i in range(100)])
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def guard():
+    return QueryGuard(max_scan_join_rows=10_000)
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT COUNT(*) FROM vehicle_ads, trim_table",
+    "SELECT COUNT(*) FROM vehicle_ads v, trim_table t",
+    "SELECT COUNT(*) FROM vehicle_ads v JOIN trim_table t",
+])
+def test_cartesian_join_is_rejected(conn, guard, query):
+    with pytest.raises(QueryRejected) as excinfo:
+        guard.preflight(conn, query, "fp")
+    assert excinfo.value.reason == "full_scan_join"
+    assert excinfo.value.details["estimated_rows"] == 200_000
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT v.Genmodel FROM vehicle_ads v, (SELECT AVG(Engine_power) AS ap FROM vehicle_ads) a "
+    "WHERE v.Engine_power > a.ap * 1.7",
+    "WITH a AS (SELECT AVG(Engine_power) AS ap FROM vehicle_ads) "
+    "SELECT v.Genmodel FROM vehicle_ads v, a WHERE v.Engine_power > a.ap * 1.7",
+])
+def test_join_with_single_row_aggregate_is_allowed(conn, guard, query):
+    guard.preflight(conn, query, "fp")
+
+
+def test_materialized_subquery_is_estimated_from_its_inner_plan(conn, guard):
+    query = ("SELECT v.Genmodel FROM vehicle_ads v, (SELECT Maker, AVG(Engine_power) AS ap FROM vehicle_ads "
+             "GROUP BY Maker) a WHERE v.Engine_power > a.ap")
+    with pytest.raises(QueryRejected) as excinfo:
+        guard.preflight(conn, query, "fp")
+    assert excinfo.value.details["estimated_rows"] == 2000 * 2000
@@ -0,0 +1,11 @@
+from session_memory import extract_entities
+
+
+def test_answer_numbers_are_not_taken_as_years():
+    found = extract_entities("What was the entry price of the Fiesta?", None, "The price was 2000, with 2019 units sold.")
+    assert found["year"] == []
+
+
+def test_years_come_from_the_question_and_answer_year_phrases():
+    found = extract_entities("Top selling cars in 2015", None, "It was first registered 2012 and sold in 2018.")
+    assert found["year"] == ["2015", "2012", "2018"]
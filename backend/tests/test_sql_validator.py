@@ -0,0 +1,85 @@
+import sqlite3
+
+import pytest
+
+from sql_validator import quote_sales_years, validate_and_correct
+
+SALES_YEARS = {"2018", "2019", "2020"}
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE sales_table (Maker TEXT, Genmodel TEXT, Genmodel_ID TEXT, "2018" INTEGER, "2019" INTEGER, "2020" INTEGER);
+        CREATE TABLE vehicle_ads (Maker TEXT, Genmodel TEXT, Genmodel_ID TEXT, Price REAL, Height REAL);
+        CREATE TABLE basic_table (Automaker TEXT, Genmodel TEXT, Genmodel_ID TEXT);
+        INSERT INTO sales_table VALUES ('VW', 'Passat', 'VW_1', 118745, 101000, 90500);
+    """)
+    yield conn
+    conn.close()
+
+
+def schema_of(conn):
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    return {t: [(row[1], row[2]) for row in conn.execute(f'PRAGMA table_info("{t}")')] for t in tables}
+
+
+def run(conn, query):
+    def compile_check(q):
+        try:
+            conn.execute(f"EXPLAIN {q}").close()
+            return None
+        except sqlite3.Error as e:
+            return str(e)
+
+    return validate_and_correct(query, compile_check, schema_of(conn), SALES_YEARS)
+
+
+def test_quotes_whole_select_terms_and_aggregate_arguments():
+    fixed, corrections = quote_sales_years("SELECT Genmodel, 2019, SUM(2020) FROM sales_table", SALES_YEARS)
+    assert fixed == 'SELECT Genmodel, "2019", SUM("2020") FROM sales_table'
+    assert len(corrections) == 2
+
+
+def test_union_of_year_labels_is_left_alone(conn):
+    query = ('SELECT Genmodel, 2018 AS Year, "2018" AS Units FROM sales_table '
+             'UNION ALL SELECT Genmodel, 2019, "2019" FROM sales_table')
+    fixed, corrections, error = run(conn, query)
+    assert (fixed, corrections, error) == (query, [], None)
+    assert conn.execute(fixed).fetchall() == [("Passat", 2018, 118745), ("Passat", 2019, 101000)]
+
+
+def test_year_in_case_is_left_alone(conn):
+    query = 'SELECT Genmodel, CASE WHEN "2019" > "2018" THEN 2019 ELSE 2018 END AS best_year FROM sales_table'
+    assert run(conn, query) == (query, [], None)
+
+
+def test_year_arithmetic_is_left_alone(conn):
+    query = 'SELECT Genmodel, 2019 - 2018 AS span, "2019" - "2018" AS change FROM sales_table'
+    assert run(conn, query) == (query, [], None)
+
+
+def test_order_by_year_is_quoted_only_when_out_of_range(conn):
+    fixed, corrections, error = run(conn, "SELECT Genmodel, 2019 FROM sales_table ORDER BY 2019 DESC")
+    assert fixed == 'SELECT Genmodel, "2019" FROM sales_table ORDER BY "2019" DESC'
+    assert error is None
+    query = "SELECT Genmodel, \"2019\" FROM sales_table ORDER BY 2"
+    assert run(conn, query) == (query, [], None)
+
+
+def test_alias_with_several_targets_in_scope_is_not_applied(conn):
+    query = "SELECT make FROM vehicle_ads v JOIN basic_table b ON v.Genmodel_ID = b.Genmodel_ID"
+    fixed, corrections, error = run(conn, query)
+    assert fixed == query and corrections == []
+    assert "Did you mean" in error and "Maker" in error and "Automaker" in error
+
+
+def test_alias_with_one_target_in_scope_is_applied(conn):
+    fixed, corrections, error = run(conn, "SELECT make FROM vehicle_ads")
+    assert fixed == "SELECT Maker FROM vehicle_ads" and error is None
+
+
+def test_fuzzy_match_is_only_suggested(conn):
+    fixed, corrections, error = run(conn, "SELECT Weight FROM vehicle_ads")
+    assert corrections == [] and "Height" in error
@@ -0,0 +1,158 @@
+import os
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Stages timed inside a request. "tool" covers a whole tool call, so it includes the
+# "sql_execute" and "serialize" time of the SQL it runs.
+STAGES = ("prompt_build", "llm", "tool", "sql_execute", "serialize")
+METRICS_SAMPLE_SIZE = int(os.environ.get("AUTOQUERY_METRICS_SAMPLE_SIZE", 2048))
+METRICS_QUANTILES = (0.5, 0.95, 0.99)
+
+_current_trace = contextvars.ContextVar("autoquery_trace", default=None)
+
+
+class Trace:
+    """Per-request stage timings. Tool calls may add to it from several threads at once."""
+
+    def __init__(self):
+        self.stages = {}
+        self.calls = {}
+        self.total_ms = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, elapsed_ms: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + elapsed_ms
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            stages = {name: round(ms, 2) for name, ms in self.stages.items()}
+        return {"total_ms": round(self.total_ms, 2), "stages": stages}
+
+
+@contextmanager
+def stage(name: str):
+    """Adds the block's wall-clock time to ``name`` in the current request's trace, if any."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, (time.perf_counter() - start) * 1000)
+
+
+@contextmanager
+def trace_request(recorder=None):
+    """Starts a trace for one request; on exit its timings are recorded in ``recorder`` (default: ``metrics``)."""
+    trace = Trace()
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.total_ms = (time.perf_counter() - start) * 1000
+        _current_trace.reset(token)
+        (recorder or metrics).record(trace)
+
+
+class LLMTimingCallback(BaseCallbackHandler):
+    """Times every chat model call into the trace that was current when the call started."""
+
+    def __init__(self):
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        trace = _current_trace.get()
+        if trace is not None:
+            with self._lock:
+                self._started[run_id] = (time.perf_counter(), trace)
+
+    def _finish(self, run_id):
+        with self._lock:
+            entry = self._started.pop(run_id, None)
+        if entry is not None:
+            start, trace = entry
+            trace.add("llm", (time.perf_counter() - start) * 1000)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+
+def _quantile(ordered: list, q: float) -> float:
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class StageMetrics:
+    """Rolling per-stage latency samples (per request) with count/sum totals, for /metrics."""
+
+    def __init__(self, sample_size: int = METRICS_SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._samples = {name: deque(maxlen=self.sample_size) for name in ("request",) + STAGES}
+            self._count = {name: 0 for name in self._samples}
+            self._sum_ms = {name: 0.0 for name in self._samples}
+
+    def record(self, trace: Trace):
+        timings = {"request": trace.total_ms, **trace.to_dict()["stages"]}
+        with self._lock:
+            for name, ms in timings.items():
+                if name not in self._samples:
+                    continue
+                self._samples[name].append(ms)
+                self._count[name] += 1
+                self._sum_ms[name] += ms
+
+    def snapshot(self) -> dict:
+        """``{stage: {count, mean_ms, p50_ms, p95_ms, p99_ms}}`` over the retained samples."""
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+            counts = dict(self._count)
+            sums = dict(self._sum_ms)
+        result = {}
+        for name, ordered in samples.items():
+            if not ordered:
+                continue
+            result[name] = {
+                "count": counts[name],
+                "mean_ms": round(sums[name] / counts[name], 2),
+                **{f"p{int(q * 100)}_ms": round(_quantile(ordered, q), 2) for q in METRICS_QUANTILES},
+            }
+        return result
+
+    def prometheus_text(self) -> str:
+        """Prometheus text exposition: one summary per stage, in seconds."""
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+            counts = dict(self._count)
+            sums = dict(self._sum_ms)
+        lines = [
+            "# HELP autoquery_stage_seconds Time spent per request in each stage (tool includes sql_execute and serialize).",
+            "# TYPE autoquery_stage_seconds summary",
+        ]
+        for name, ordered in samples.items():
+            for q in METRICS_QUANTILES:
+                value = f"{_quantile(ordered, q) / 1000:.6f}" if ordered else "NaN"
+                lines.append(f'autoquery_stage_seconds{{stage="{name}",quantile="{q}"}} {value}')
+            lines.append(f'autoquery_stage_seconds_sum{{stage="{name}"}} {sums[name] / 1000:.6f}')
+            lines.append(f'autoquery_stage_seconds_count{{stage="{name}"}} {counts[name]}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = StageMetrics()
+llm_timing = LLMTimingCallback()
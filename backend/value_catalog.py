@@ -0,0 +1,115 @@
+import difflib
+import threading
+import logging
+
+FUZZY_CUTOFF = 0.75
+
+
+def normalize_name(value) -> str:
+    """Key used for name matching: upper-case alphanumerics only ("F-150" -> "F150")."""
+    return "".join(ch for ch in str(value).upper() if ch.isalnum())
+
+
+class ValueCatalog:
+    """In-memory copy of the value catalog tables written by create_database.py.
+
+    Serves column summaries and name lookups (exact, normalized, prefix and fuzzy)
+    without touching the vehicle tables.
+    """
+
+    def __init__(self, columns: dict, values: dict, entities: dict):
+        # (table, column) -> (cardinality, non_null_count)
+        self.columns = columns
+        # (table, column) -> [(value, frequency, normalized)] ordered by frequency
+        self.values = values
+        # kind -> {normalized: [(value, frequency)]}
+        self.entities = entities
+
+    @classmethod
+    def load(cls, db):
+        """Reads the catalog tables through ``db``. Returns None if the DB has no catalog."""
+        try:
+            column_rows = db.fetch_all(
+                "SELECT table_name, column_name, cardinality, non_null_count FROM value_catalog_columns"
+            )
+            value_rows = db.fetch_all(
+                "SELECT table_name, column_name, value, frequency, normalized FROM value_catalog "
+                "ORDER BY table_name, column_name, rank"
+            )
+            entity_rows = db.fetch_all(
+                "SELECT kind, normalized, value, frequency FROM value_catalog_entities ORDER BY frequency DESC"
+            )
+        except Exception as e:
+            logging.warning(f"Value catalog unavailable, falling back to SQL lookups: {e}")
+            return None
+
+        columns = {(t, c): (card, non_null) for t, c, card, non_null in column_rows}
+        values = {}
+        for t, c, value, freq, normalized in value_rows:
+            values.setdefault((t, c), []).append((value, freq, normalized))
+        entities = {}
+        for kind, normalized, value, freq in entity_rows:
+            entities.setdefault(kind, {}).setdefault(normalized, []).append((value, freq))
+        logging.info(f"Loaded value catalog: {len(columns)} text columns, {len(value_rows)} values.")
+        return cls(columns, values, entities)
+
+    def has_column(self, table_name: str, column_name: str) -> bool:
+        return (table_name, column_name) in self.columns
+
+    def top_values(self, table_name: str, column_name: str, limit: int = 20):
+        return [(v, f) for v, f, _ in self.values.get((table_name, column_name), [])[:limit]]
+
+    def search(self, table_name: str, column_name: str, term: str, limit: int = 10):
+        """Matches ``term`` against a column's values.
+
+        Returns ``(match_type, [(value, frequency)])`` trying, in order: exact normalized
+        match, prefix match, substring match and fuzzy match.
+        """
+        entries = self.values.get((table_name, column_name), [])
+        key = normalize_name(term)
+        if not key:
+            return "none", []
+
+        exact = [(v, f) for v, f, n in entries if n == key]
+        if exact:
+            return "exact", exact[:limit]
+        prefix = [(v, f) for v, f, n in entries if n.startswith(key)]
+        if prefix:
+            return "prefix", prefix[:limit]
+        contains = [(v, f) for v, f, n in entries if key in n]
+        if contains:
+            return "substring", contains[:limit]
+
+        by_normalized = {}
+        for v, f, n in entries:
+            by_normalized.setdefault(n, []).append((v, f))
+        close = difflib.get_close_matches(key, list(by_normalized), n=limit, cutoff=FUZZY_CUTOFF)
+        return ("fuzzy" if close else "none"), [vf for n in close for vf in by_normalized[n]][:limit]
+
+    def resolve(self, kind: str, term: str, fuzzy: bool = True):
+        """Canonical values of an entity kind ("maker", "model", "color", "bodytype") for a name."""
+        index = self.entities.get(kind, {})
+        key = normalize_name(term)
+        if key in index:
+            return index[key]
+        if fuzzy and key:
+            close = difflib.get_close_matches(key, list(index), n=1, cutoff=FUZZY_CUTOFF + 0.1)
+            if close:
+                return index[close[0]]
+        return []
+
+
+_catalog = None
+_catalog_fingerprint = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog(db):
+    """Returns the process-wide catalog for ``db``, reloading it when the DB file changes."""
+    global _catalog, _catalog_fingerprint
+    fingerprint = db.pool.fingerprint()
+    with _catalog_lock:
+        if _catalog_fingerprint != fingerprint:
+            _catalog = ValueCatalog.load(db)
+            _catalog_fingerprint = fingerprint
+        return _catalog
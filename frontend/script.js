@@ -9,6 +9,10 @@ document.addEventListener('DOMContentLoaded', () => {
     const agentStepsCode = document.getElementById('agent-steps-code');
 
     const API_URL = 'https://backend-dot-autoquery-472902.ue.r.appspot.com/api/chat';
+    const STREAM_URL = `${API_URL}/stream`;
+
+    // Conversation memory lives on the server, keyed by this ID; it survives page reloads in the same tab.
+    let sessionId = sessionStorage.getItem('autoquery-session-id');
 
     let chatHistory = [
         { sender: 'agent', message: 'Welcome to AutoQuery! How can I help you find vehicle data today?' }
@@ -35,21 +39,89 @@ document.addEventListener('DOMContentLoaded', () => {
         sendButton.disabled = disabled;
     }
 
+    // Parses one SSE block ("event: x\ndata: {...}") into { event, data }.
+    function parseSseEvent(block) {
+        let event = 'message';
+        const dataLines = [];
+        block.split('\n').forEach(line => {
+            if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+        });
+        if (!dataLines.length) return null;
+        return { event, data: JSON.parse(dataLines.join('\n')) };
+    }
+
     async function sendMessageToApi(userMessage) {
         loadingIndicator.style.display = 'block';
         errorDisplay.style.display = 'none';
         agentStepsContainer.style.display = 'none';
+        agentStepsCode.textContent = '';
         setInteractionState(true);
 
         chatHistory.push({ sender: 'user', message: userMessage });
         renderMessages();
         messageInput.value = '';
 
+        const startedAt = performance.now();
+        let firstByteMs = null;
+        let firstProgressMs = null;
+        let firstTokenMs = null;
+        const agentEntry = { sender: 'agent', message: '' };
+
+        function appendStep(text) {
+            agentStepsCode.textContent += text + '\n';
+            agentStepsContainer.style.display = 'block';
+        }
+
+        function handleEvent({ event, data }) {
+            if (firstProgressMs === null && ['tool_call', 'observation', 'token', 'final'].includes(event)) {
+                firstProgressMs = performance.now() - startedAt;
+            }
+            if (event === 'llm_start') {
+                // Text from a model turn that ends up calling a tool is replaced by the next turn.
+                agentEntry.message = '';
+            } else if (event === 'tool_call') {
+                appendStep(`Tool Used: ${data.tool}`);
+                appendStep(data.sql ? `SQL: ${data.sql}` : `Tool Input: ${JSON.stringify(data.input)}`);
+            } else if (event === 'observation') {
+                appendStep(`Result (${data.lines} lines): ${data.summary}\n`);
+            } else if (event === 'token') {
+                if (firstTokenMs === null) firstTokenMs = performance.now() - startedAt;
+                if (!chatHistory.includes(agentEntry)) chatHistory.push(agentEntry);
+                loadingIndicator.style.display = 'none';
+                agentEntry.message += data.text;
+                renderMessages();
+            } else if (event === 'final') {
+                if (data.session_id && data.session_id !== sessionId) {
+                    sessionId = data.session_id;
+                    sessionStorage.setItem('autoquery-session-id', sessionId);
+                }
+                if (!agentStepsCode.textContent && data.agent_steps) appendStep(data.agent_steps);
+                agentEntry.message = data.final_response || "Received an empty response.";
+                if (!chatHistory.includes(agentEntry)) chatHistory.push(agentEntry);
+                renderMessages();
+            } else if (event === 'error') {
+                throw new Error(data.error);
+            } else if (event === 'done') {
+                const totalMs = performance.now() - startedAt;
+                const fmt = ms => (ms === null ? 'n/a' : `${Math.round(ms)} ms`);
+                appendStep(`First byte: ${fmt(firstByteMs)} | First token: ${fmt(firstTokenMs)} | Total: ${fmt(totalMs)}`);
+                console.info('AutoQuery stream timings (client):', { firstByteMs, firstProgressMs, firstTokenMs, totalMs }, '(server):', data);
+                // The server only knows when it yielded each event; report when the bytes actually arrived.
+                fetch(`${STREAM_URL}/timings`, {
+                    method: 'POST',
+                    keepalive: true,
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ first_byte_ms: firstByteMs, first_token_ms: firstTokenMs, total_ms: totalMs }),
+                }).catch(() => {});
+            }
+        }
+
         try {
-            const response = await fetch(API_URL, {
+            const response = await fetch(STREAM_URL, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ message: userMessage }),
+                body: JSON.stringify({ message: userMessage, session_id: sessionId }),
             });
 
             if (!response.ok) {
@@ -57,17 +129,22 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(errorData.error || `Request failed (${response.status})`);
             }
 
-            const data = await response.json();
-            
-            if (data.agent_steps) {
-                agentStepsCode.textContent = data.agent_steps;
-                agentStepsContainer.style.display = 'block';
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                if (firstByteMs === null) firstByteMs = performance.now() - startedAt;
+                buffer += decoder.decode(value, { stream: true });
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const parsed = parseSseEvent(buffer.slice(0, boundary));
+                    buffer = buffer.slice(boundary + 2);
+                    if (parsed) handleEvent(parsed);
+                }
             }
 
-            const agentMessage = data.final_response || "Received an empty response.";
-            chatHistory.push({ sender: 'agent', message: agentMessage });
-            renderMessages();
-
         } catch (error) {
             console.error('API Error:', error);
             displayError(error.message);